@@ -7,26 +7,157 @@ import os
 import datetime
 import sys
 import random 
+import argparse
+import collections
+import threading
+import concurrent.futures
+import struct
+import array
+import mmap
+import bisect
+import math
+import copy
+import contextlib
+import cProfile
+import pstats
+import types
+import tempfile
+import gzip
+import lzma
+import shutil
+import itertools
+import heapq
+import atexit
+import signal
 
-# Importar `msvcrt` apenas se for Windows
+# Importar `msvcrt` apenas se for Windows e `fcntl` nos demais sistemas
 if platform.system() == "Windows":
     import msvcrt
     MSVCRT_LK_UNLCK = 0  # Release lock
     MSVCRT_LK_LOCK = 1   # Lock for exclusive use
     MSVCRT_LK_NBLCK = 4  # Non-blocking lock for writing - this is usually the one you want for polling
+    fcntl = None
+
+    import ctypes
+    from ctypes import wintypes
+
+    # msvcrt.locking(LK_LOCK) só tenta 10 vezes, uma por segundo: a espera bloqueante usa LockFileEx
+    # sobre o mesmo byte 0, que o SO libera para o próximo da fila assim que o dono solta o bloqueio.
+    LOCKFILE_EXCLUSIVE_LOCK = 0x00000002
+
+    class _Overlapped(ctypes.Structure):
+        _fields_ = [
+            ("Internal", ctypes.c_void_p), ("InternalHigh", ctypes.c_void_p),
+            ("Offset", wintypes.DWORD), ("OffsetHigh", wintypes.DWORD), ("hEvent", wintypes.HANDLE)
+        ]
+
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    _kernel32.LockFileEx.argtypes = [
+        wintypes.HANDLE, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, ctypes.POINTER(_Overlapped)
+    ]
+    _kernel32.LockFileEx.restype = wintypes.BOOL
+
+    def _win_blocking_lock(fd):
+        """Bloqueia o primeiro byte de `fd` esperando no SO, sem limite de tempo."""
+        overlapped = _Overlapped()
+        handle = wintypes.HANDLE(msvcrt.get_osfhandle(fd))
+        if not _kernel32.LockFileEx(handle, LOCKFILE_EXCLUSIVE_LOCK, 0, 1, 0, ctypes.byref(overlapped)):
+            raise ctypes.WinError(ctypes.get_last_error())
 else:
     msvcrt = None
-    logging.warning("msvcrt não está disponível (não é Windows). O bloqueio de arquivo simples não funcionará de forma confiável.")
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+        logging.warning("Nem msvcrt nem fcntl disponíveis. O bloqueio de arquivo usará apenas leases.")
 
 try:
     import wmi
 except ImportError:
     wmi = None
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # --- Variáveis Globais de Configuração ---
 SHARED_NETWORK_PATH = ""
 COLLECTION_INTERVAL_SECONDS = 10
 MACHINE_ALIAS = ""
+STORAGE_FORMAT = "jsonl"  # "jsonl" (append-only, uma linha por amostra) ou "json" (array legado)
+SHARDED_STORAGE = True  # Cada máquina escreve apenas no próprio arquivo; o arquivo geral é montado pelo modo merger
+SPOOL_ENABLED = True  # Amostras passam por um spool local e são enviadas em lotes ao SHARED_NETWORK_PATH
+SPOOL_MAX_MB = 50
+SPOOL_MAX_AGE_HOURS = 72
+SPOOL_FLUSH_INTERVAL_SECONDS = 30
+COLUMNAR_STORAGE = False  # Grava também as métricas numéricas em '{alias}.cols' (formato colunar binário)
+ROLLUPS_ENABLED = True  # Gera agregados por minuto/hora/dia em '{mes}/rollups/'
+RAW_RETENTION_MONTHS = 0  # Meses de dados brutos mantidos por máquina (0 = sem limite); os agregados são mantidos
+DELTA_ENCODING = False  # Arquivo da máquina recebe só o que mudou; campos estáticos vão para '{mes}/inventario/'
+METRICS_ENABLED = True  # Grava tempos por etapa e consumo do próprio agente em '{mes}/metricas/'
+METRICS_DUMP_INTERVAL_SECONDS = 300
+PROFILE_ENABLED = False  # Perfila o ciclo de coleta com cProfile e grava em 'perfil_agente.prof' ao lado do agente
+COLLECTOR_TIMEOUT_SECONDS = 5  # Tempo máximo de espera por coletor (psutil, WMI, sensores) em cada ciclo
+METRIC_GROUP_INTERVALS = {"disco": 300, "inventario": 300}  # Intervalo próprio por grupo de métricas; grupos ausentes usam COLLECTION_INTERVAL_SECONDS
+LINUX_PROCFS_ENABLED = True  # No Linux, lê CPU, memória, rede, discos e temperaturas direto de /proc e /sys em vez do psutil
+PROCESS_COLLECTOR_ENABLED = False  # Coleta os processos que mais usam CPU, memória e E/S (grupo "processos")
+PROCESS_TOP_N = 5
+PROCESS_SCAN_BUDGET_MS = 200  # Tempo máximo de varredura de processos por ciclo; o restante fica para o ciclo seguinte
+COMPRESSION_FORMAT = "gzip"  # Compactação dos meses fechados pelo merger/--compactar: "gzip", "lzma" ou "" (desativada)
+COMPACTION_GRACE_HOURS = 72  # Horas após o fim do mês antes de compactá-lo (tempo para os spools esvaziarem)
+
+# --- Sensores ---
+HARDWARE_INVENTORY_TTL_SECONDS = 600  # Validade do cache do inventário de hardware do Open Hardware Monitor
+
+# --- Grupos de métricas ---
+# Cada coletor pertence a um grupo, coletado no intervalo definido em METRIC_GROUP_INTERVALS.
+METRIC_GROUPS = ("cpu_rede", "sensores", "disco", "inventario", "processos")
+COLLECTOR_GROUPS = {
+    "psutil": "cpu_rede",  # CPU, memória, rede, E/S de disco e uptime
+    "procfs": "cpu_rede",  # O mesmo no Linux, com uso por núcleo, vazão por interface e E/S por disco
+    "ohm": "sensores",  # Temperaturas, clocks, energia, GPU e SMART (Open Hardware Monitor)
+    "hwmon": "sensores",
+    "sensores_linux": "sensores",
+    "psutil_disco": "disco",  # Espaço do disco principal
+    "psutil_inventario": "inventario",  # Quantidade de núcleos e horário de boot
+    "processos": "processos"  # Top N processos por CPU, memória e E/S
+}
+
+# --- Formato do timestamp dos registros ---
+TIMESTAMP_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# --- Formatos de armazenamento suportados ---
+STORAGE_FORMATS = ("jsonl", "json")
+COMPRESSION_FORMATS = {"gzip": ".gz", "lzma": ".xz"}  # Extensão acrescentada a '.jsonl' nos meses compactados
+COMPRESSION_CHUNK_RECORDS = 1000  # Registros por quadro compactado (unidade de leitura das consultas)
+COMPACTION_CHECK_INTERVAL_SECONDS = 3600  # Frequência com que o merger procura meses fechados para compactar
+
+# --- Nomes de arquivos do diretório mensal ---
+GENERAL_FILE_BASENAME = "dados_gerais_mensal"
+MERGE_STATE_FILE_NAME = "dados_gerais_mensal.offsets.json"
+MERGE_MAX_BYTES_PER_PASS = 16 * 1024 * 1024  # Limite lido por arquivo de máquina a cada passada do merger
+
+# --- Agregados e inventário ---
+ROLLUP_DIR_NAME = "rollups"
+ROLLUP_JOURNAL_FILE_NAME = "rollups_abertos.jsonl"  # Local, ao lado do agente: amostras das janelas ainda abertas
+INVENTORY_DIR_NAME = "inventario"
+
+# --- Métricas do agente ---
+METRICS_DIR_NAME = "metricas"
+PROFILE_FILE_NAME = "perfil_agente.prof"
+
+# --- Modo consumidor ---
+CONSUMER_CHECKPOINT_FILE_NAME = "consumidor_offsets.json"
+CONSUMER_SNAPSHOT_FILE_NAME = "estado_frota.json"
+CONSUMER_SNAPSHOT_INTERVAL_SECONDS = 30
+
+# --- Índice temporal ---
+INDEX_BUCKET_SECONDS = 300  # Granularidade do índice '.idx' dos arquivos de máquina
+
+# --- Spool local ---
+SPOOL_DIR_NAME = "spool"
+SPOOL_SEGMENT_MAX_BYTES = 1024 * 1024  # Granularidade da rotação e do descarte por limite de tamanho
 
 # --- Configurações de Retry ---
 MAX_RETRIES = 5  
@@ -58,370 +189,3529 @@ logger.addHandler(file_handler)
 
 logging.root = logger 
 
+# --- Valores padrão do config.json ---
+DEFAULT_CONFIG = {
+    "SHARED_NETWORK_PATH": r"\\10.10.10.61\ti\SIA",
+    "COLLECTION_INTERVAL_SECONDS": 10,
+    "MACHINE_ALIAS": "",
+    "STORAGE_FORMAT": "jsonl",
+    "SHARDED_STORAGE": True,
+    "SPOOL_ENABLED": True,
+    "SPOOL_MAX_MB": 50,
+    "SPOOL_MAX_AGE_HOURS": 72,
+    "SPOOL_FLUSH_INTERVAL_SECONDS": 30,
+    "COLLECTOR_TIMEOUT_SECONDS": 5,
+    "METRIC_GROUP_INTERVALS": {"disco": 300, "inventario": 300},
+    "LINUX_PROCFS_ENABLED": True,
+    "PROCESS_COLLECTOR_ENABLED": False,
+    "PROCESS_TOP_N": 5,
+    "PROCESS_SCAN_BUDGET_MS": 200,
+    "COMPRESSION_FORMAT": "gzip",
+    "COMPACTION_GRACE_HOURS": 72,
+    "COLUMNAR_STORAGE": False,
+    "ROLLUPS_ENABLED": True,
+    "RAW_RETENTION_MONTHS": 0,
+    "DELTA_ENCODING": False,
+    "METRICS_ENABLED": True,
+    "METRICS_DUMP_INTERVAL_SECONDS": 300,
+    "PROFILE_ENABLED": False
+}
+
+def _apply_configuration(config):
+    """Aplica um dicionário de configuração às variáveis globais, usando os valores padrão para chaves ausentes."""
+    global SHARED_NETWORK_PATH, COLLECTION_INTERVAL_SECONDS, MACHINE_ALIAS, STORAGE_FORMAT, SHARDED_STORAGE
+    global SPOOL_ENABLED, SPOOL_MAX_MB, SPOOL_MAX_AGE_HOURS, SPOOL_FLUSH_INTERVAL_SECONDS, COLLECTOR_TIMEOUT_SECONDS
+    global COLUMNAR_STORAGE, ROLLUPS_ENABLED, RAW_RETENTION_MONTHS, DELTA_ENCODING
+    global METRICS_ENABLED, METRICS_DUMP_INTERVAL_SECONDS, PROFILE_ENABLED, METRIC_GROUP_INTERVALS
+    global LINUX_PROCFS_ENABLED, COMPRESSION_FORMAT, COMPACTION_GRACE_HOURS
+    global PROCESS_COLLECTOR_ENABLED, PROCESS_TOP_N, PROCESS_SCAN_BUDGET_MS
+
+    SHARED_NETWORK_PATH = config.get("SHARED_NETWORK_PATH", DEFAULT_CONFIG["SHARED_NETWORK_PATH"])
+    COLLECTION_INTERVAL_SECONDS = config.get("COLLECTION_INTERVAL_SECONDS", DEFAULT_CONFIG["COLLECTION_INTERVAL_SECONDS"])
+    MACHINE_ALIAS = config.get("MACHINE_ALIAS", DEFAULT_CONFIG["MACHINE_ALIAS"])
+    STORAGE_FORMAT = config.get("STORAGE_FORMAT", DEFAULT_CONFIG["STORAGE_FORMAT"])
+    if STORAGE_FORMAT not in STORAGE_FORMATS:
+        logging.warning(f"STORAGE_FORMAT '{STORAGE_FORMAT}' inválido. Usando '{DEFAULT_CONFIG['STORAGE_FORMAT']}'.")
+        STORAGE_FORMAT = DEFAULT_CONFIG["STORAGE_FORMAT"]
+    SHARDED_STORAGE = bool(config.get("SHARDED_STORAGE", DEFAULT_CONFIG["SHARDED_STORAGE"]))
+    if SHARDED_STORAGE and STORAGE_FORMAT != "jsonl":
+        logging.warning("SHARDED_STORAGE requer STORAGE_FORMAT 'jsonl'. Usando o arquivo geral compartilhado (modo legado).")
+        SHARDED_STORAGE = False
+    SPOOL_ENABLED = bool(config.get("SPOOL_ENABLED", DEFAULT_CONFIG["SPOOL_ENABLED"]))
+    SPOOL_MAX_MB = config.get("SPOOL_MAX_MB", DEFAULT_CONFIG["SPOOL_MAX_MB"])
+    SPOOL_MAX_AGE_HOURS = config.get("SPOOL_MAX_AGE_HOURS", DEFAULT_CONFIG["SPOOL_MAX_AGE_HOURS"])
+    SPOOL_FLUSH_INTERVAL_SECONDS = config.get("SPOOL_FLUSH_INTERVAL_SECONDS", DEFAULT_CONFIG["SPOOL_FLUSH_INTERVAL_SECONDS"])
+    COLLECTOR_TIMEOUT_SECONDS = config.get("COLLECTOR_TIMEOUT_SECONDS", DEFAULT_CONFIG["COLLECTOR_TIMEOUT_SECONDS"])
+    METRIC_GROUP_INTERVALS = {}
+    for group, interval in (config.get("METRIC_GROUP_INTERVALS", DEFAULT_CONFIG["METRIC_GROUP_INTERVALS"]) or {}).items():
+        if group not in METRIC_GROUPS:
+            logging.warning(f"Grupo de métricas '{group}' desconhecido em METRIC_GROUP_INTERVALS. Grupos válidos: {', '.join(METRIC_GROUPS)}.")
+        elif not isinstance(interval, (int, float)) or interval <= 0:
+            logging.warning(f"Intervalo inválido para o grupo '{group}': {interval}. Usando COLLECTION_INTERVAL_SECONDS.")
+        else:
+            METRIC_GROUP_INTERVALS[group] = interval
+    LINUX_PROCFS_ENABLED = bool(config.get("LINUX_PROCFS_ENABLED", DEFAULT_CONFIG["LINUX_PROCFS_ENABLED"]))
+    PROCESS_COLLECTOR_ENABLED = bool(config.get("PROCESS_COLLECTOR_ENABLED", DEFAULT_CONFIG["PROCESS_COLLECTOR_ENABLED"]))
+    PROCESS_TOP_N = config.get("PROCESS_TOP_N", DEFAULT_CONFIG["PROCESS_TOP_N"])
+    PROCESS_SCAN_BUDGET_MS = config.get("PROCESS_SCAN_BUDGET_MS", DEFAULT_CONFIG["PROCESS_SCAN_BUDGET_MS"])
+    COMPRESSION_FORMAT = config.get("COMPRESSION_FORMAT", DEFAULT_CONFIG["COMPRESSION_FORMAT"]) or ""
+    if COMPRESSION_FORMAT and COMPRESSION_FORMAT not in COMPRESSION_FORMATS:
+        logging.warning(f"COMPRESSION_FORMAT '{COMPRESSION_FORMAT}' inválido. Usando '{DEFAULT_CONFIG['COMPRESSION_FORMAT']}'.")
+        COMPRESSION_FORMAT = DEFAULT_CONFIG["COMPRESSION_FORMAT"]
+    COMPACTION_GRACE_HOURS = config.get("COMPACTION_GRACE_HOURS", DEFAULT_CONFIG["COMPACTION_GRACE_HOURS"])
+    COLUMNAR_STORAGE = bool(config.get("COLUMNAR_STORAGE", DEFAULT_CONFIG["COLUMNAR_STORAGE"]))
+    ROLLUPS_ENABLED = bool(config.get("ROLLUPS_ENABLED", DEFAULT_CONFIG["ROLLUPS_ENABLED"]))
+    RAW_RETENTION_MONTHS = config.get("RAW_RETENTION_MONTHS", DEFAULT_CONFIG["RAW_RETENTION_MONTHS"])
+    DELTA_ENCODING = bool(config.get("DELTA_ENCODING", DEFAULT_CONFIG["DELTA_ENCODING"]))
+    METRICS_ENABLED = bool(config.get("METRICS_ENABLED", DEFAULT_CONFIG["METRICS_ENABLED"]))
+    METRICS_DUMP_INTERVAL_SECONDS = config.get("METRICS_DUMP_INTERVAL_SECONDS", DEFAULT_CONFIG["METRICS_DUMP_INTERVAL_SECONDS"])
+    PROFILE_ENABLED = bool(config.get("PROFILE_ENABLED", DEFAULT_CONFIG["PROFILE_ENABLED"]))
+    if DELTA_ENCODING and STORAGE_FORMAT != "jsonl":
+        logging.warning("DELTA_ENCODING requer STORAGE_FORMAT 'jsonl'. Codificação delta desativada.")
+        DELTA_ENCODING = False
+
 # --- Função para carregar configurações ---
 def load_configuration(config_file_name="config.json"):
-    global SHARED_NETWORK_PATH, COLLECTION_INTERVAL_SECONDS, MACHINE_ALIAS
-    
     config_path = os.path.join(application_path, config_file_name)
 
     if not os.path.exists(config_path):
         logging.warning(f"Arquivo de configuração '{config_path}' não encontrado. Criando um arquivo padrão.")
-        default_config = {
-            "SHARED_NETWORK_PATH": r"\\10.10.10.61\ti\SIA",
-            "COLLECTION_INTERVAL_SECONDS": 10,
-            "MACHINE_ALIAS": ""
-        }
+        default_config = dict(DEFAULT_CONFIG)
         try:
             with open(config_path, 'w') as f:
                 json.dump(default_config, f, indent=4)
             logging.info(f"Arquivo de configuração padrão criado em: {config_path}")
         except Exception as e:
             logging.error(f"Erro ao criar arquivo de configuração padrão: {e}")
-            SHARED_NETWORK_PATH = default_config["SHARED_NETWORK_PATH"]
-            COLLECTION_INTERVAL_SECONDS = default_config["COLLECTION_INTERVAL_SECONDS"]
-            MACHINE_ALIAS = default_config["MACHINE_ALIAS"]
+            _apply_configuration(default_config)
             return False 
 
     try:
         with open(config_path, 'r') as f:
             config = json.load(f)
         
-        SHARED_NETWORK_PATH = config.get("SHARED_NETWORK_PATH", r"\\10.10.10.61\ti\SIA")
-        COLLECTION_INTERVAL_SECONDS = config.get("COLLECTION_INTERVAL_SECONDS", 10)
-        MACHINE_ALIAS = config.get("MACHINE_ALIAS", "")
+        _apply_configuration(config)
         
-        logging.info(f"Configurações carregadas de '{config_path}'. Caminho de rede: {SHARED_NETWORK_PATH}, Intervalo: {COLLECTION_INTERVAL_SECONDS}s, Apelido da Máquina: '{MACHINE_ALIAS}'")
+        logging.info(f"Configurações carregadas de '{config_path}'. Caminho de rede: {SHARED_NETWORK_PATH}, Intervalo: {COLLECTION_INTERVAL_SECONDS}s, Apelido da Máquina: '{MACHINE_ALIAS}', Formato: {STORAGE_FORMAT}, Particionado: {SHARDED_STORAGE}")
         return True 
     except json.JSONDecodeError:
         logging.error(f"Erro ao decodificar JSON do arquivo de configuração '{config_path}'. Verifique o formato. Usando valores padrão.")
-        SHARED_NETWORK_PATH = r"\\10.10.10.61\ti\SIA"
-        COLLECTION_INTERVAL_SECONDS = 10
-        MACHINE_ALIAS = ""
+        _apply_configuration({})
         return False
     except Exception as e:
         logging.error(f"Erro inesperado ao carregar arquivo de configuração '{config_path}': {e}. Usando valores padrão.")
-        SHARED_NETWORK_PATH = r"\\10.10.10.61\ti\SIA"
-        COLLECTION_INTERVAL_SECONDS = 10
-        MACHINE_ALIAS = ""
+        _apply_configuration({})
         return False
 
-def get_hardware_data():
-    """Coleta os dados de hardware e sistema e os consolida em um único objeto."""
-    
-    final_data = {}
-    monitoramento_data = {
+# --- Instrumentação do agente ---
+# Tempos por etapa do caminho quente (coletores, consultas WMI, bloqueios, leitura/parse, serialização, escrita),
+# guardados em janelas recentes por etapa e gravados periodicamente em '{mes}/metricas/{apelido}.jsonl'.
+METRICS_WINDOW = 500  # Quantidade de medições recentes mantidas por etapa
+
+
+class StageMetrics:
+    """Histogramas em janela (p50/p95/máximo) dos tempos de cada etapa, seguros entre threads."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self._counts = collections.Counter()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            counts = dict(self._counts)
+        summary = {}
+        for stage, values in samples.items():
+            if not values:
+                continue
+            summary[stage] = {
+                "n": counts[stage],
+                "p50_ms": round(values[len(values) // 2] * 1000, 3),
+                "p95_ms": round(values[max(0, math.ceil(0.95 * len(values)) - 1)] * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3)
+            }
+        return summary
+
+
+stage_metrics = StageMetrics()
+
+
+class AgentProfiler:
+    """
+    Um cProfile.Profile por thread, mesclados ao gravar. O cProfile só perfila a thread que chamou
+    enable(), então cada thread (laço principal, coletores, envio do spool) liga o seu próprio perfil.
+    No Python 3.12+ só um perfil pode estar ativo por vez (e ele vê todas as threads); as demais
+    threads seguem sem perfilar enquanto ele estiver ligado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profilers = {}
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def profiled(self):
+        if getattr(self._local, "active", False):
+            yield
+            return
+        thread_id = threading.get_ident()
+        with self._lock:
+            entry = self._profilers.get(thread_id)
+            if entry is None:
+                entry = self._profilers[thread_id] = (cProfile.Profile(), threading.Lock())
+        profile, profile_lock = entry
+        with profile_lock:
+            try:
+                profile.enable()
+            except ValueError:
+                enabled = False
+            else:
+                enabled = True
+            self._local.active = True
+            try:
+                yield
+            finally:
+                self._local.active = False
+                if enabled:
+                    profile.disable()
+
+    def dump_stats(self, path):
+        """Grava em `path` as estatísticas acumuladas de todas as threads."""
+        with self._lock:
+            entries = list(self._profilers.values())
+        merged = None
+        for profile, profile_lock in entries:
+            with profile_lock:
+                try:
+                    stats = pstats.Stats(profile)
+                except TypeError:
+                    continue  # perfil ainda sem chamadas
+            if merged is None:
+                merged = stats
+            else:
+                merged.add(stats)
+        if merged is not None:
+            merged.dump_stats(path)
+
+
+agent_profiler = None
+
+def profiled():
+    """Perfila o bloco na thread atual quando PROFILE_ENABLED estiver ligado."""
+    return agent_profiler.profiled() if agent_profiler is not None else contextlib.nullcontext()
+
+_agent_process = None
+
+def get_agent_resource_usage():
+    """CPU (% desde a última chamada), memória residente e threads do próprio agente."""
+    global _agent_process
+    if _agent_process is None:
+        _agent_process = psutil.Process()
+        _agent_process.cpu_percent(interval=None)
+    with _agent_process.oneshot():
+        cpu_times = _agent_process.cpu_times()
+        return {
+            "cpu_percent": _agent_process.cpu_percent(interval=None),
+            "cpu_user_s": round(cpu_times.user, 2),
+            "cpu_system_s": round(cpu_times.system, 2),
+            "rss_mb": round(_agent_process.memory_info().rss / (1024**2), 2),
+            "threads": threading.active_count()
+        }
+
+def build_metrics_record(machine_alias):
+    now = datetime.datetime.now()
+    return {
+        "hostname": platform.node(),
+        "machine_alias": machine_alias,
+        "timestamp_coleta": now.strftime(TIMESTAMP_FORMAT),
+        "timestamp_epoch": int(now.timestamp()),
+        "intervalo_coleta_s": COLLECTION_INTERVAL_SECONDS,
+        "etapas": stage_metrics.snapshot(),
+        "locks": get_lock_wait_stats(),
+        "agente": get_agent_resource_usage()
+    }
+
+def start_metrics_reporter(base_path, machine_alias, interval_seconds, write_metrics=True, profiler=None):
+    """
+    Inicia a thread que grava as métricas do agente a cada `interval_seconds`.
+    Com `profiler` (AgentProfiler), grava também as estatísticas acumuladas em PROFILE_FILE_NAME.
+    """
+    def _report_loop():
+        while True:
+            time.sleep(interval_seconds)
+            if write_metrics:
+                record = build_metrics_record(machine_alias)
+                metrics_path = os.path.join(base_path, datetime.datetime.now().strftime("%Y-%m"), METRICS_DIR_NAME)
+                try:
+                    os.makedirs(metrics_path, exist_ok=True)
+                    append_jsonl_records(os.path.join(metrics_path, f"{machine_alias}.jsonl"), [record], metrics_stage="metricas")
+                except OSError as e:
+                    logging.error(f"Erro ao gravar métricas do agente em '{metrics_path}': {e}")
+            if profiler is not None:
+                try:
+                    profiler.dump_stats(os.path.join(application_path, PROFILE_FILE_NAME))
+                except Exception as e:
+                    logging.error(f"Erro ao gravar perfil do agente: {e}")
+
+    reporter = threading.Thread(target=_report_loop, name="metricas-agente", daemon=True)
+    reporter.start()
+    return reporter
+
+
+# --- Coletores ---
+# Cada coletor devolve um fragmento de `monitoramento` que é mesclado ao registro final.
+# Os coletores rodam em paralelo, cada um em sua própria thread (ver `_run_collectors`).
+
+# Contadores da coleta anterior, usados para calcular taxas (rede/disco) sem dormir durante a coleta.
+_previous_counters = {}
+
+def _new_monitoramento_data():
+    return {
         "cpu": {}, "memoria_ram": {}, "disco_principal": {},
         "discos_adicionais": [], "gpu": {}, "rede": {},
         "placa_mae": {}, "uptime_horas": None
     }
 
+def _counter_rate(name, current_value, now):
+    """Taxa por segundo de um contador cumulativo em relação à coleta anterior (None na primeira coleta ou se o contador reiniciou)."""
+    previous = _previous_counters.get(name)
+    _previous_counters[name] = (current_value, now)
+    if previous is None:
+        return None
+    previous_value, previous_time = previous
+    elapsed = now - previous_time
+    if elapsed <= 0 or current_value < previous_value:
+        return None
+    return (current_value - previous_value) / elapsed
+
+_boot_time = None  # Atualizado pelo coletor de inventário
+
+def _get_boot_time():
+    global _boot_time
+    if _boot_time is None:
+        _boot_time = psutil.boot_time()
+    return _boot_time
+
+def _collect_psutil(main_disk_path):
+    """CPU, memória, rede, E/S de disco e uptime via psutil. Nenhuma chamada bloqueia."""
+    monitoramento_data = _new_monitoramento_data()
+    now = time.monotonic()
+
+    cpu_percent = psutil.cpu_percent(interval=None) 
+    mem = psutil.virtual_memory()
+    net_io = psutil.net_io_counters()
+
+    bytes_per_second = _counter_rate("rede_bytes", net_io.bytes_sent + net_io.bytes_recv, now)
+    network_speed_mbps = round(bytes_per_second * 8 / 1_000_000, 2) if bytes_per_second is not None else None
+
+    monitoramento_data['cpu']['percentual_uso'] = cpu_percent
+    monitoramento_data['memoria_ram']['total_gb'] = round(mem.total / (1024**3), 2)
+    monitoramento_data['memoria_ram']['usado_gb'] = round(mem.used / (1024**3), 2)
+    monitoramento_data['memoria_ram']['percentual_uso'] = mem.percent
+    monitoramento_data['rede']['bytes_enviados_mb'] = round(net_io.bytes_sent / (1024**2), 2)
+    monitoramento_data['rede']['bytes_recebidos_mb'] = round(net_io.bytes_recv / (1024**2), 2)
+    monitoramento_data['rede']['velocidade_atual_mbps'] = network_speed_mbps
+    monitoramento_data['uptime_horas'] = round((time.time() - _get_boot_time()) / 3600, 2)
+
     try:
-        cpu_percent = psutil.cpu_percent(interval=None) 
-        mem = psutil.virtual_memory()
-        main_disk_path = 'C:\\' if platform.system() == "Windows" else '/'
-        disk_usage_main = psutil.disk_usage(main_disk_path)
-        
-        net_io_before = psutil.net_io_counters()
-        time.sleep(1) 
-        net_io_after = psutil.net_io_counters()
-
-        bytes_sent_diff = net_io_after.bytes_sent - net_io_before.bytes_sent
-        bytes_recv_diff = net_io_after.bytes_recv - net_io_before.bytes_recv 
-        network_speed_mbps = round((bytes_sent_diff + bytes_recv_diff) * 8 / 1_000_000, 2) 
-
-        monitoramento_data['cpu']['percentual_uso'] = cpu_percent
-        monitoramento_data['cpu']['nucleos_fisicos'] = psutil.cpu_count(logical=False)
-        monitoramento_data['cpu']['nucleos_logicos'] = psutil.cpu_count(logical=True)
-        monitoramento_data['memoria_ram']['total_gb'] = round(mem.total / (1024**3), 2)
-        monitoramento_data['memoria_ram']['usado_gb'] = round(mem.used / (1024**3), 2)
-        monitoramento_data['memoria_ram']['percentual_uso'] = mem.percent
-        monitoramento_data['disco_principal']['total_gb'] = round(disk_usage_main.total / (1024**3), 2)
-        monitoramento_data['disco_principal']['usado_gb'] = round(disk_usage_main.used / (1024**3), 2)
-        monitoramento_data['disco_principal']['livre_gb'] = round(disk_usage_main.free / (1024**3), 2)
-        monitoramento_data['disco_principal']['percentual_uso'] = disk_usage_main.percent
-        monitoramento_data['rede']['bytes_enviados_mb'] = round(net_io_after.bytes_sent / (1024**2), 2)
-        monitoramento_data['rede']['bytes_recebidos_mb'] = round(net_io_after.bytes_recv / (1024**2), 2)
-        monitoramento_data['rede']['velocidade_atual_mbps'] = network_speed_mbps
-        monitoramento_data['uptime_horas'] = round((time.time() - psutil.boot_time()) / 3600, 2)
-        
-        final_data['hostname'] = platform.node()
-        final_data['machine_alias'] = MACHINE_ALIAS if MACHINE_ALIAS else final_data['hostname']
-        final_data['timestamp_coleta'] = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        final_data['monitoramento'] = monitoramento_data
+        disk_io = psutil.disk_io_counters()
+    except Exception as e:
+        disk_io = None
+        logging.info(f"Contadores de E/S de disco indisponíveis: {e}")
+    if disk_io is not None:
+        read_rate = _counter_rate("disco_leitura_bytes", disk_io.read_bytes, now)
+        write_rate = _counter_rate("disco_escrita_bytes", disk_io.write_bytes, now)
+        monitoramento_data['disco_io'] = {
+            "leitura_mb_s": round(read_rate / (1024**2), 2) if read_rate is not None else None,
+            "escrita_mb_s": round(write_rate / (1024**2), 2) if write_rate is not None else None
+        }
+
+    return monitoramento_data
+
+def _collect_psutil_disk(main_disk_path):
+    """Espaço do disco principal via psutil."""
+    monitoramento_data = _new_monitoramento_data()
+    disk_usage_main = psutil.disk_usage(main_disk_path)
+    monitoramento_data['disco_principal']['total_gb'] = round(disk_usage_main.total / (1024**3), 2)
+    monitoramento_data['disco_principal']['usado_gb'] = round(disk_usage_main.used / (1024**3), 2)
+    monitoramento_data['disco_principal']['livre_gb'] = round(disk_usage_main.free / (1024**3), 2)
+    monitoramento_data['disco_principal']['percentual_uso'] = disk_usage_main.percent
+    return monitoramento_data
+
+def _collect_psutil_inventory(main_disk_path):
+    """Quantidade de núcleos e horário de boot via psutil (mudam raramente)."""
+    global _boot_time
+    monitoramento_data = _new_monitoramento_data()
+    monitoramento_data['cpu']['nucleos_fisicos'] = psutil.cpu_count(logical=False)
+    monitoramento_data['cpu']['nucleos_logicos'] = psutil.cpu_count(logical=True)
+    _boot_time = psutil.boot_time()
+    return monitoramento_data
 
-        if platform.system() == "Windows" and wmi is not None:
+# --- Processos (top N) ---
+# Cache por PID de objetos psutil.Process e atributos estáticos (nome, executável, usuário): a cada ciclo só os
+# contadores voláteis são relidos, e o uso de CPU e E/S vem da diferença em relação ao ciclo anterior.
+# A varredura para ao atingir PROCESS_SCAN_BUDGET_MS e continua do mesmo ponto no ciclo seguinte.
+class ProcessTracker:
+    """Mantém o cache de processos e monta os rankings por CPU, memória e E/S."""
+
+    def __init__(self, top_n=None, scan_budget_seconds=None):
+        self.top_n = PROCESS_TOP_N if top_n is None else top_n
+        self.scan_budget_seconds = PROCESS_SCAN_BUDGET_MS / 1000 if scan_budget_seconds is None else scan_budget_seconds
+        self._cache = {}
+        self._next_pid = 0
+        self._cpu_count = psutil.cpu_count(logical=True) or 1
+
+    def _new_entry(self, pid):
+        process = psutil.Process(pid)
+        entry = {"processo": process, "pid": pid, "nome": None, "executavel": None, "usuario": None}
+        with process.oneshot():
+            for key, getter in (("nome", process.name), ("executavel", process.exe), ("usuario", process.username)):
+                try:
+                    entry[key] = getter()
+                except (psutil.AccessDenied, OSError):
+                    pass
+        return entry
+
+    def _sample(self, entry, now):
+        process = entry["processo"]
+        if not process.is_running():
+            # O create_time do PID mudou: ele foi reutilizado por outro processo.
+            return False
+        with process.oneshot():
+            cpu_times = process.cpu_times()
+            rss = process.memory_info().rss
             try:
-                c = wmi.WMI(namespace="root\\OpenHardwareMonitor")
-                hardware_info = c.Hardware()
-                
-                cpu_processed = False
-                gpu_processed = False
-                main_disk_processed = False
-                mainboard_processed = False
-
-                for hw in hardware_info:
-                    component_type = hw.HardwareType.lower()
-                    component_name = hw.Name
-                    
-                    temp_sensors_data = {}
-                    sensors_wmi = c.Sensor(Parent=hw.Identifier)
-                    
-                    for sensor in sensors_wmi:
-                        sensor_type = sensor.SensorType.lower()
-                        sensor_name_key = sensor.Name.replace(" ", "_").replace("(", "").replace(")", "").replace("-", "_").replace("#", "").lower()
-                        
-                        if sensor_type not in temp_sensors_data:
-                            temp_sensors_data[sensor_type] = {}
-                        temp_sensors_data[sensor_type][sensor_name_key] = round(sensor.Value, 2)
-                    
-                    if component_type == "cpu" and not cpu_processed:
-                        monitoramento_data['cpu']['nome'] = component_name
-                        if 'temperature' in temp_sensors_data:
-                            if 'cpu_package' in temp_sensors_data['temperature']:
-                                monitoramento_data['cpu']['temperatura_package_celsius'] = temp_sensors_data['temperature']['cpu_package']
-                            core_temps = {}
-                            for k, v in temp_sensors_data['temperature'].items():
-                                if 'cpu_core' in k:
-                                    core_temps[k] = v
-                            if core_temps:
-                                monitoramento_data['cpu']['temperaturas_cores_celsius'] = core_temps
-                        if 'load' in temp_sensors_data:
-                             monitoramento_data['cpu']['uso_total_percent'] = temp_sensors_data['load'].get('cpu_total')
-                        if 'power' in temp_sensors_data:
-                            monitoramento_data['cpu']['energia_watts'] = temp_sensors_data['power']
-                        if 'clock' in temp_sensors_data:
-                            monitoramento_data['cpu']['clocks_mhz'] = temp_sensors_data['clock']
-                        cpu_processed = True
-                    elif "gpu" in component_type and not gpu_processed:
-                        monitoramento_data['gpu']['nome'] = component_name
-                        monitoramento_data['gpu']['tipo'] = hw.HardwareType
-                        if 'temperature' in temp_sensors_data and 'gpu_core' in temp_sensors_data['temperature']:
-                            monitoramento_data['gpu']['temperatura_core_celsius'] = temp_sensors_data['temperature']['gpu_core']
-                        if 'load' in temp_sensors_data and 'gpu_core' in temp_sensors_data['load']:
-                            monitoramento_data['gpu']['uso_percentual'] = temp_sensors_data['load']['gpu_core']
-                        if 'smalldata' in temp_sensors_data: 
-                            monitoramento_data['gpu']['memoria_gpu'] = {
-                                "usada_mb": temp_sensors_data['smalldata'].get('gpu_memory_used'),
-                                "livre_mb": temp_sensors_data['smalldata'].get('gpu_memory_free'),
-                                "total_mb": temp_sensors_data['smalldata'].get('gpu_memory_total')
-                            }
-                        if 'clock' in temp_sensors_data:
-                            monitoramento_data['gpu']['clocks_mhz'] = temp_sensors_data['clock']
-                        gpu_processed = True
-                    elif component_type == "hdd":
-                        disk_entry = {
-                            "nome": component_name,
-                            "tipo": hw.HardwareType
-                        }
-                        if 'temperature' in temp_sensors_data and 'temperature' in temp_sensors_data['temperature']:
-                            disk_entry['temperatura_celsius'] = temp_sensors_data['temperature']['temperature']
-                            if not main_disk_processed and (main_disk_path in component_name or "ssd" in component_name.lower()): 
-                                monitoramento_data['disco_principal']['nome'] = component_name
-                                monitoramento_data['disco_principal']['temperatura_celsius'] = disk_entry['temperatura_celsius']
-                                main_disk_processed = True
-                        if 'load' in temp_sensors_data and 'used_space' in temp_sensors_data['load']:
-                            disk_entry['uso_espaco_percent'] = temp_sensors_data['load']['used_space']
-                            if not main_disk_processed and (main_disk_path in component_name or "ssd" in component_name.lower()):
-                                monitoramento_data['disco_principal']['uso_espaco_percent'] = disk_entry['uso_espaco_percent']
-                                main_disk_processed = True
-                        if 'level' in temp_sensors_data and 'remaining_life' in temp_sensors_data['level']:
-                            disk_entry['vida_util_restante_percent'] = temp_sensors_data['level']['remaining_life']
-                            if not main_disk_processed and (main_disk_path in component_name or "ssd" in component_name.lower()):
-                                monitoramento_data['disco_principal']['vida_util_restante_percent'] = disk_entry['vida_util_restante_percent']
-                                main_disk_processed = True
-                        if 'data' in temp_sensors_data and 'total_bytes_written' in temp_sensors_data['data']:
-                            disk_entry['dados_gravados_tb'] = round(temp_sensors_data['data']['total_bytes_written'] / (1024**4), 2)
-                        if not main_disk_processed or monitoramento_data['disco_principal'].get('nome') != component_name:
-                            monitoramento_data['discos_adicionais'].append(disk_entry)
-                    elif component_type == "mainboard" and not mainboard_processed:
-                        monitoramento_data['placa_mae']['nome'] = component_name
-                        if 'temperature' in temp_sensors_data:
-                            monitoramento_data['placa_mae']['temperaturas_celsius'] = temp_sensors_data['temperature']
-                        mainboard_processed = True
-                
-                logging.info("Dados detalhados do Open Hardware Monitor coletados com sucesso.")
+                io = process.io_counters()
+                io_bytes = io.read_bytes + io.write_bytes
+            except (psutil.AccessDenied, AttributeError, OSError):
+                io_bytes = None
+        cpu_seconds = cpu_times.user + cpu_times.system
+        previous = entry.get("anterior")
+        entry["anterior"] = (cpu_seconds, io_bytes, now)
+        entry["memoria_mb"] = round(rss / (1024**2), 1)
+        if previous is None:
+            return True
+        previous_cpu, previous_io, previous_time = previous
+        elapsed = now - previous_time
+        if elapsed > 0 and cpu_seconds >= previous_cpu:
+            entry["cpu_percent"] = round(100 * (cpu_seconds - previous_cpu) / elapsed / self._cpu_count, 1)
+            if io_bytes is not None and previous_io is not None and io_bytes >= previous_io:
+                entry["io_mb_s"] = round((io_bytes - previous_io) / (1024**2) / elapsed, 2)
+        return True
 
-            except wmi.x_wmi as e:
-                logging.error(f"Erro WMI ao obter dados do Open Hardware Monitor. Verifique se o OHM está rodando e o namespace está acessível: {e}")
-            except Exception as e:
-                logging.error(f"Erro inesperado ao tentar obter dados detalhados via Open Hardware Monitor: {e}")
-        
-        elif platform.system() == "Linux" and hasattr(psutil, "sensors_temperatures"):
-            temps = psutil.sensors_temperatures()
-            if temps:
-                cpu_temp = temps.get('coretemp') or temps.get('cpu_thermal')
-                if cpu_temp:
-                    monitoramento_data['cpu']['nome'] = "CPU (Linux)"
-                    monitoramento_data['cpu']['temperatura_package_celsius'] = cpu_temp[0].current if cpu_temp else None
-                    core_temps = {}
-                    for i, entry in enumerate(cpu_temp):
-                        if 'current' in entry._fields:
-                            core_temps[f"core_{entry.label or i+1}"] = entry.current
-                    monitoramento_data['cpu']['temperaturas_cores_celsius'] = core_temps
-                logging.info("Temperaturas básicas da CPU coletadas via psutil (Linux).")
-            else:
-                logging.info("Linux: psutil.sensors_temperatures() retornou vazio ou não é suportado.")
+    def scan(self):
+        """Relê os processos até o limite de tempo e retorna o fragmento de `monitoramento` com os rankings."""
+        started = time.monotonic()
+        deadline = started + self.scan_budget_seconds
+        pids = sorted(psutil.pids())
+        alive = set(pids)
+        for pid in [pid for pid in self._cache if pid not in alive]:
+            del self._cache[pid]
+
+        start = bisect.bisect_left(pids, self._next_pid)
+        order = pids[start:] + pids[:start]
+        scanned = 0
+        for pid in order:
+            if time.monotonic() >= deadline:
+                self._next_pid = pid
+                break
+            try:
+                entry = self._cache.get(pid)
+                if entry is None:
+                    entry = self._cache[pid] = self._new_entry(pid)
+                if not self._sample(entry, time.monotonic()):
+                    entry = self._cache[pid] = self._new_entry(pid)
+                    self._sample(entry, time.monotonic())
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                self._cache.pop(pid, None)
+            except (psutil.AccessDenied, OSError):
+                pass
+            scanned += 1
         else:
-            logging.info("Coleta detalhada de hardware (via Open Hardware Monitor) não suportada neste SO ou módulo WMI não disponível.")
+            self._next_pid = 0
 
-    except Exception as e:
-        logging.error(f"Erro geral ao coletar dados de hardware: {e}")
-        return None
-    
-    return final_data
+        monitoramento_data = _new_monitoramento_data()
+        monitoramento_data['processos'] = {
+            "total": len(pids),
+            "varridos": scanned,
+            "varredura_completa": scanned == len(pids),
+            "varredura_ms": round((time.monotonic() - started) * 1000, 1),
+            "top_cpu": self._top("cpu_percent"),
+            "top_memoria": self._top("memoria_mb"),
+            "top_io": self._top("io_mb_s")
+        }
+        return monitoramento_data
 
-def acquire_file_lock(file_path, timeout_seconds=10, check_interval_seconds=0.1):
+    def _top(self, metric):
+        ranked = heapq.nlargest(
+            self.top_n,
+            (entry for entry in self._cache.values() if entry.get(metric) is not None),
+            key=lambda entry: entry[metric]
+        )
+        return [
+            {key: entry.get(key) for key in ("pid", "nome", "executavel", "usuario", "cpu_percent", "memoria_mb", "io_mb_s")}
+            for entry in ranked
+        ]
+
+_process_tracker = None
+
+def _collect_processes(main_disk_path):
+    """Top N processos por CPU, memória e E/S via psutil."""
+    global _process_tracker
+    if _process_tracker is None:
+        _process_tracker = ProcessTracker()
+    return _process_tracker.scan()
+
+# --- Provedores de sensores (Open Hardware Monitor) ---
+HardwareInfo = collections.namedtuple("HardwareInfo", "identifier name hardware_type")
+SensorReading = collections.namedtuple("SensorReading", "parent name sensor_type value")
+
+class SensorProvider:
     """
-    Tenta adquirir um bloqueio de arquivo simples criando/acessando um arquivo .lock.
-    Retorna o caminho para o arquivo de lock se o bloqueio for adquirido, None caso contrário.
+    Interface de acesso aos sensores do Open Hardware Monitor.
+    `get_hardware()` retorna o inventário (lista de HardwareInfo) e `get_sensors()` todas as leituras
+    (lista de SensorReading) em uma única consulta. Implementações de teste podem servir dados em memória.
     """
-    if msvcrt is None:
-        logging.error("msvcrt não está disponível, bloqueio de arquivo não suportado neste SO.")
-        return None
 
-    lock_file_path = file_path + ".lock"
-    start_time = time.time()
+    def get_hardware(self):
+        raise NotImplementedError
+
+    def get_sensors(self):
+        raise NotImplementedError
+
+
+class WmiSensorProvider(SensorProvider):
+    """
+    Provedor WMI com conexão persistente ao namespace root\\OpenHardwareMonitor.
+    O inventário de hardware é mantido em cache e só é relido após `inventory_ttl_seconds`
+    ou quando aparece um sensor de hardware desconhecido. Em erro WMI a conexão é descartada
+    e refeita na próxima chamada. Deve ser usado sempre na mesma thread (apartamento COM).
+    """
+
+    def __init__(self, namespace="root\\OpenHardwareMonitor", inventory_ttl_seconds=HARDWARE_INVENTORY_TTL_SECONDS):
+        self.namespace = namespace
+        self.inventory_ttl_seconds = inventory_ttl_seconds
+        self._connection = None
+        self._inventory = None
+        self._inventory_loaded_at = 0.0
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = wmi.WMI(namespace=self.namespace)
+            self._inventory = None
+            logging.info(f"Conexão WMI aberta em '{self.namespace}'.")
+        return self._connection
+
+    def reset(self):
+        """Descarta a conexão e o inventário; a próxima chamada reconecta."""
+        self._connection = None
+        self._inventory = None
 
-    while time.time() - start_time < timeout_seconds:
+    def invalidate_inventory(self, min_age_seconds=60):
+        """Força a releitura do inventário, no máximo uma vez a cada `min_age_seconds`."""
+        if time.monotonic() - self._inventory_loaded_at >= min_age_seconds:
+            self._inventory = None
+
+    def get_hardware(self):
+        now = time.monotonic()
+        if self._inventory is None or now - self._inventory_loaded_at > self.inventory_ttl_seconds:
+            try:
+                with stage_metrics.timed("wmi.hardware"):
+                    self._inventory = [
+                        HardwareInfo(hw.Identifier, hw.Name, hw.HardwareType)
+                        for hw in self._connect().query("SELECT Identifier, Name, HardwareType FROM Hardware")
+                    ]
+            except wmi.x_wmi:
+                self.reset()
+                raise
+            self._inventory_loaded_at = now
+        return self._inventory
+
+    def get_sensors(self):
         try:
-            # Tenta abrir o arquivo de lock em modo exclusivo (x)
-            # Se já existir e estiver bloqueado, vai falhar (FileExistsError)
-            fd = os.open(lock_file_path, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-            # Tenta bloquear o arquivo
-            msvcrt.locking(fd, MSVCRT_LK_LOCK, 1) # Bloqueia 1 byte do arquivo
-            os.close(fd) # Fecha o descritor de arquivo, mas o bloqueio persiste no Windows
-            logging.debug(f"Bloqueio adquirido para: {lock_file_path}")
-            return lock_file_path
-        except FileExistsError:
-            logging.debug(f"Arquivo de lock '{lock_file_path}' já existe. Esperando...")
-            time.sleep(check_interval_seconds)
-        except PermissionError:
-            logging.debug(f"Permissão negada ao tentar criar/acessar '{lock_file_path}'. Esperando...")
-            time.sleep(check_interval_seconds)
-        except Exception as e:
-            logging.warning(f"Erro inesperado ao tentar adquirir bloqueio para '{lock_file_path}': {e}. Esperando...")
-            time.sleep(check_interval_seconds)
-    
-    logging.error(f"Não foi possível adquirir bloqueio para '{file_path}' após {timeout_seconds} segundos.")
-    return None
+            with stage_metrics.timed("wmi.sensores"):
+                return [
+                    SensorReading(sensor.Parent, sensor.Name, sensor.SensorType, sensor.Value)
+                    for sensor in self._connect().query("SELECT Parent, Name, SensorType, Value FROM Sensor")
+                ]
+        except wmi.x_wmi:
+            self.reset()
+            raise
+
+
+class FakeSensorProvider(SensorProvider):
+    """Provedor em memória, para testar e medir o processamento dos sensores sem WMI."""
+
+    def __init__(self, hardware, sensors):
+        self.hardware = list(hardware)
+        self.sensors = list(sensors)
+
+    def get_hardware(self):
+        return self.hardware
+
+    def get_sensors(self):
+        return self.sensors
+
+
+_sensor_key_cache = {}
+
+def _sensor_name_key(sensor_name):
+    key = _sensor_key_cache.get(sensor_name)
+    if key is None:
+        key = sensor_name.replace(" ", "_").replace("(", "").replace(")", "").replace("-", "_").replace("#", "").lower()
+        _sensor_key_cache[sensor_name] = key
+    return key
+
+def group_sensors_by_parent(sensors):
+    """Agrupa as leituras em {identificador_do_hardware: {tipo_do_sensor: {nome_normalizado: valor}}}."""
+    grouped = {}
+    for sensor in sensors:
+        if sensor.value is None:
+            continue
+        by_type = grouped.setdefault(sensor.parent, {})
+        by_type.setdefault(sensor.sensor_type.lower(), {})[_sensor_name_key(sensor.name)] = round(sensor.value, 2)
+    return grouped
 
-def release_file_lock(lock_file_path):
-    """Libera o bloqueio de arquivo removendo o arquivo .lock."""
-    if msvcrt is None:
-        return 
+def parse_ohm_sensors(hardware_info, sensors, main_disk_path):
+    """Converte inventário e leituras do Open Hardware Monitor em um fragmento de `monitoramento`."""
+    monitoramento_data = _new_monitoramento_data()
+    cpu_processed = False
+    gpu_processed = False
+    main_disk_processed = False
+    mainboard_processed = False
+
+    sensors_by_parent = group_sensors_by_parent(sensors)
+
+    for hw in hardware_info:
+        component_type = hw.hardware_type.lower()
+        component_name = hw.name
+        temp_sensors_data = sensors_by_parent.get(hw.identifier, {})
+
+        if component_type == "cpu" and not cpu_processed:
+            monitoramento_data['cpu']['nome'] = component_name
+            if 'temperature' in temp_sensors_data:
+                if 'cpu_package' in temp_sensors_data['temperature']:
+                    monitoramento_data['cpu']['temperatura_package_celsius'] = temp_sensors_data['temperature']['cpu_package']
+                core_temps = {}
+                for k, v in temp_sensors_data['temperature'].items():
+                    if 'cpu_core' in k:
+                        core_temps[k] = v
+                if core_temps:
+                    monitoramento_data['cpu']['temperaturas_cores_celsius'] = core_temps
+            if 'load' in temp_sensors_data:
+                 monitoramento_data['cpu']['uso_total_percent'] = temp_sensors_data['load'].get('cpu_total')
+            if 'power' in temp_sensors_data:
+                monitoramento_data['cpu']['energia_watts'] = temp_sensors_data['power']
+            if 'clock' in temp_sensors_data:
+                monitoramento_data['cpu']['clocks_mhz'] = temp_sensors_data['clock']
+            cpu_processed = True
+        elif "gpu" in component_type and not gpu_processed:
+            monitoramento_data['gpu']['nome'] = component_name
+            monitoramento_data['gpu']['tipo'] = hw.hardware_type
+            if 'temperature' in temp_sensors_data and 'gpu_core' in temp_sensors_data['temperature']:
+                monitoramento_data['gpu']['temperatura_core_celsius'] = temp_sensors_data['temperature']['gpu_core']
+            if 'load' in temp_sensors_data and 'gpu_core' in temp_sensors_data['load']:
+                monitoramento_data['gpu']['uso_percentual'] = temp_sensors_data['load']['gpu_core']
+            if 'smalldata' in temp_sensors_data: 
+                monitoramento_data['gpu']['memoria_gpu'] = {
+                    "usada_mb": temp_sensors_data['smalldata'].get('gpu_memory_used'),
+                    "livre_mb": temp_sensors_data['smalldata'].get('gpu_memory_free'),
+                    "total_mb": temp_sensors_data['smalldata'].get('gpu_memory_total')
+                }
+            if 'clock' in temp_sensors_data:
+                monitoramento_data['gpu']['clocks_mhz'] = temp_sensors_data['clock']
+            gpu_processed = True
+        elif component_type == "hdd":
+            disk_entry = {
+                "nome": component_name,
+                "tipo": hw.hardware_type
+            }
+            if 'temperature' in temp_sensors_data and 'temperature' in temp_sensors_data['temperature']:
+                disk_entry['temperatura_celsius'] = temp_sensors_data['temperature']['temperature']
+                if not main_disk_processed and (main_disk_path in component_name or "ssd" in component_name.lower()): 
+                    monitoramento_data['disco_principal']['nome'] = component_name
+                    monitoramento_data['disco_principal']['temperatura_celsius'] = disk_entry['temperatura_celsius']
+                    main_disk_processed = True
+            if 'load' in temp_sensors_data and 'used_space' in temp_sensors_data['load']:
+                disk_entry['uso_espaco_percent'] = temp_sensors_data['load']['used_space']
+                if not main_disk_processed and (main_disk_path in component_name or "ssd" in component_name.lower()):
+                    monitoramento_data['disco_principal']['uso_espaco_percent'] = disk_entry['uso_espaco_percent']
+                    main_disk_processed = True
+            if 'level' in temp_sensors_data and 'remaining_life' in temp_sensors_data['level']:
+                disk_entry['vida_util_restante_percent'] = temp_sensors_data['level']['remaining_life']
+                if not main_disk_processed and (main_disk_path in component_name or "ssd" in component_name.lower()):
+                    monitoramento_data['disco_principal']['vida_util_restante_percent'] = disk_entry['vida_util_restante_percent']
+                    main_disk_processed = True
+            if 'data' in temp_sensors_data and 'total_bytes_written' in temp_sensors_data['data']:
+                disk_entry['dados_gravados_tb'] = round(temp_sensors_data['data']['total_bytes_written'] / (1024**4), 2)
+            if not main_disk_processed or monitoramento_data['disco_principal'].get('nome') != component_name:
+                monitoramento_data['discos_adicionais'].append(disk_entry)
+        elif component_type == "mainboard" and not mainboard_processed:
+            monitoramento_data['placa_mae']['nome'] = component_name
+            if 'temperature' in temp_sensors_data:
+                monitoramento_data['placa_mae']['temperaturas_celsius'] = temp_sensors_data['temperature']
+            mainboard_processed = True
+
+    return monitoramento_data
+
+_sensor_provider = None
+
+def get_sensor_provider():
+    """Provedor de sensores em uso (criado na primeira chamada, na thread do coletor OHM)."""
+    global _sensor_provider
+    if _sensor_provider is None:
+        _sensor_provider = WmiSensorProvider()
+    return _sensor_provider
+
+def set_sensor_provider(provider):
+    """Substitui o provedor de sensores (ex.: FakeSensorProvider em testes e benchmarks)."""
+    global _sensor_provider
+    _sensor_provider = provider
+
+def _collect_ohm_sensors(main_disk_path):
+    """Sensores detalhados (temperaturas, clocks, energia, GPU, discos) via Open Hardware Monitor/WMI."""
     try:
-        if os.path.exists(lock_file_path):
-            os.remove(lock_file_path)
-            logging.debug(f"Bloqueio liberado para: {lock_file_path}")
+        provider = get_sensor_provider()
+        hardware_info = provider.get_hardware()
+        sensors = provider.get_sensors()
+        known_identifiers = {hw.identifier for hw in hardware_info}
+        if isinstance(provider, WmiSensorProvider) and any(sensor.parent not in known_identifiers for sensor in sensors):
+            provider.invalidate_inventory()
+            hardware_info = provider.get_hardware()
+        monitoramento_data = parse_ohm_sensors(hardware_info, sensors, main_disk_path)
+        logging.info("Dados detalhados do Open Hardware Monitor coletados com sucesso.")
+        return monitoramento_data
+
     except Exception as e:
-        logging.error(f"Erro ao liberar bloqueio para '{lock_file_path}': {e}")
+        if wmi is not None and isinstance(e, wmi.x_wmi):
+            logging.error(f"Erro WMI ao obter dados do Open Hardware Monitor. Verifique se o OHM está rodando e o namespace está acessível: {e}")
+        else:
+            logging.error(f"Erro inesperado ao tentar obter dados detalhados via Open Hardware Monitor: {e}")
+    return _new_monitoramento_data()
 
+def _collect_linux_sensors(main_disk_path):
+    """Temperaturas básicas da CPU via psutil (Linux)."""
+    monitoramento_data = _new_monitoramento_data()
+    temps = psutil.sensors_temperatures()
+    if temps:
+        cpu_temp = temps.get('coretemp') or temps.get('cpu_thermal')
+        if cpu_temp:
+            monitoramento_data['cpu']['nome'] = "CPU (Linux)"
+            monitoramento_data['cpu']['temperatura_package_celsius'] = cpu_temp[0].current if cpu_temp else None
+            core_temps = {}
+            for i, entry in enumerate(cpu_temp):
+                if 'current' in entry._fields:
+                    core_temps[f"core_{entry.label or i+1}"] = entry.current
+            monitoramento_data['cpu']['temperaturas_cores_celsius'] = core_temps
+        logging.info("Temperaturas básicas da CPU coletadas via psutil (Linux).")
+    else:
+        logging.info("Linux: psutil.sensors_temperatures() retornou vazio ou não é suportado.")
+    return monitoramento_data
 
-def write_data_to_files(data, base_path):
+# --- Coletor nativo Linux (procfs/sysfs) ---
+# Lê /proc/stat, /proc/meminfo, /proc/net/dev, /proc/diskstats, /proc/uptime e /sys/class/hwmon diretamente.
+# Os arquivos ficam abertos e são relidos com um pread por ciclo; as taxas vêm da diferença entre ciclos.
+PROCFS_READ_SIZE = 64 * 1024
+PROCFS_FILES = ("proc/stat", "proc/meminfo", "proc/net/dev", "proc/diskstats", "proc/uptime")
+DISKSTATS_SECTOR_BYTES = 512
+HWMON_CPU_CHIPS = ("coretemp", "k10temp", "zenpower", "cpu_thermal", "soc_thermal")
+HWMON_GPU_CHIPS = ("amdgpu", "nouveau", "radeon")
+HWMON_DISK_CHIPS = ("nvme", "drivetemp")
+
+class ProcfsReader:
     """
-    Escreve os dados coletados em:
-    1. Acumula os dados em um JSON individual da máquina.
-    2. Adiciona uma entrada ao JSON geral mensal (um único arquivo por mês).
-    Implementa retries com backoff e um bloqueio de arquivo simples.
+    Leitor de procfs/sysfs com descritores persistentes. `root` permite apontar para uma árvore de
+    arquivos de teste (ex.: uma cópia de /proc e /sys em um diretório) em vez da raiz do sistema.
     """
-    if not data:
-        logging.error("Dados vazios para escrita. Não será salvo.")
-        return False
 
-    current_date = datetime.datetime.now()
-    month_folder = current_date.strftime("%Y-%m")
-    monthly_path = os.path.join(base_path, month_folder)
+    def __init__(self, root="/"):
+        self.root = root
+        self._fds = {}
+        self._previous = {}
+        self._hwmon_inputs = None
+        self._disk_names = None
+        self._whole_disks = None
 
-    if not os.path.exists(monthly_path):
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def missing_files(self):
+        """Arquivos do procfs usados pelo coletor que não podem ser lidos. Não altera o estado das taxas."""
+        return [relative_path for relative_path in PROCFS_FILES if not os.access(self._path(relative_path), os.R_OK)]
+
+    def read_file(self, relative_path):
+        """Conteúdo atual do arquivo, relido do início com pread no descritor mantido aberto."""
+        fd = self._fds.get(relative_path)
+        if fd is None:
+            fd = os.open(self._path(relative_path), os.O_RDONLY)
+            self._fds[relative_path] = fd
+        chunks = []
+        offset = 0
         try:
-            os.makedirs(monthly_path)
-            logging.info(f"Pasta mensal '{monthly_path}' criada com sucesso.")
-        except OSError as e:
-            logging.error(f"Erro ao criar pasta mensal '{monthly_path}': {e}")
-            return False
+            while True:
+                chunk = os.pread(fd, PROCFS_READ_SIZE, offset)
+                chunks.append(chunk)
+                offset += len(chunk)
+                if len(chunk) < PROCFS_READ_SIZE:
+                    break
+        except OSError:
+            # Arquivo removido (ex.: sensor ou disco desconectado): reabre na próxima leitura.
+            self._close(relative_path)
+            raise
+        return b"".join(chunks).decode("ascii", "replace")
 
-    file_identifier = data.get('machine_alias', data['hostname'])
-    
-    def _write_json_with_retries(file_full_path, data_to_append, is_general_json=False):
-        current_backoff = INITIAL_BACKOFF_SECONDS
-        for attempt in range(MAX_RETRIES):
-            lock_path = None
+    def _close(self, relative_path):
+        fd = self._fds.pop(relative_path, None)
+        if fd is not None:
             try:
-                lock_path = acquire_file_lock(file_full_path, timeout_seconds=INITIAL_BACKOFF_SECONDS)
-                if lock_path is None:
-                    raise Exception("Não foi possível adquirir o bloqueio de arquivo.")
+                os.close(fd)
+            except OSError:
+                pass
 
-                content_list = []
-                
-                if os.path.exists(file_full_path):
-                    with open(file_full_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content:
-                            try:
-                                content_list = json.loads(content)
-                                if not isinstance(content_list, list):
-                                    # Se não for uma lista, considera corrompido ou formato inesperado.
-                                    # Não sobrescreve, apenas loga e falha esta tentativa para retry.
-                                    raise ValueError(f"Conteúdo de JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' não é uma lista. Possivelmente corrompido ou formato inesperado.")
-                            except json.JSONDecodeError as e:
-                                # JSON está malformado. Loga e falha esta tentativa para retry.
-                                raise json.JSONDecodeError(f"JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' corrompido: {e}", e.doc, e.pos)
-                            except Exception as e:
-                                # Outros erros inesperados na leitura. Loga e falha esta tentativa para retry.
-                                raise Exception(f"Erro inesperado ao ler JSON {'geral' if is_general_json else 'individual'} '{file_full_path}': {e}")
-                
-                content_list.append(data_to_append) 
-                
-                # Escreve o JSON atualizado
-                with open(file_full_path, 'w', encoding='utf-8') as f:
-                    json.dump(content_list, f, indent=4)
-                
-                logging.info(f"JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' atualizado com sucesso na tentativa {attempt + 1}.")
-                return True
+    def close(self):
+        for relative_path in list(self._fds):
+            self._close(relative_path)
 
-            except (json.JSONDecodeError, ValueError, Exception) as e:
-                # Capture os erros de JSONDecodeError, ValueError (formato) e outros erros
-                # Aumente o nível do log para ERROR para esses casos, para indicar um problema
-                # persistente que impede a escrita dos dados.
-                log_message = f"Não foi possível processar JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' na tentativa {attempt + 1}/{MAX_RETRIES}: {e}. O arquivo existente NÃO será sobrescrito. Tentando novamente em {current_backoff:.2f} segundos."
-                if attempt == MAX_RETRIES - 1: # Se for a última tentativa, loga como ERROR
-                    logging.error(log_message)
-                else:
-                    logging.warning(log_message)
-            finally:
-                if lock_path:
-                    release_file_lock(lock_path)
-            
-            sleep_time = current_backoff + random.uniform(0, current_backoff * 0.1) 
-            time.sleep(min(sleep_time, MAX_BACKOFF_SECONDS))
-            current_backoff *= 2 
-            
-        logging.error(f"Falha CRÍTICA ao atualizar JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' após {MAX_RETRIES} tentativas. Os dados não foram salvos e o arquivo original (corrompido ou não) foi mantido.")
-        return False
+    def _rates(self, name, counters, now):
+        """Diferenças por segundo de cada contador em relação à leitura anterior de `name` (None na primeira leitura)."""
+        previous = self._previous.get(name)
+        self._previous[name] = (counters, now)
+        if previous is None:
+            return None
+        previous_counters, previous_time = previous
+        elapsed = now - previous_time
+        if elapsed <= 0:
+            return None
+        return previous_counters, elapsed
 
-    # --- Chamadas das funções auxiliares ---
+    def read_cpu(self, now):
+        """Uso total e por núcleo (%) a partir de /proc/stat."""
+        counters = {}
+        for line in self.read_file("proc/stat").splitlines():
+            if not line.startswith("cpu"):
+                break
+            fields = line.split()
+            values = [int(value) for value in fields[1:9]]
+            idle = values[3] + values[4]
+            counters[fields[0]] = (sum(values) - idle, sum(values))
+        rates = self._rates("cpu", counters, now)
+        if rates is None:
+            return None, {}
+        previous_counters = rates[0]
+        usage = {}
+        for name, (busy, total) in counters.items():
+            if name not in previous_counters:
+                continue
+            previous_busy, previous_total = previous_counters[name]
+            delta_total = total - previous_total
+            if delta_total > 0:
+                usage[name] = round(max(0.0, min(100.0, 100.0 * (busy - previous_busy) / delta_total)), 1)
+        total_usage = usage.pop("cpu", None)
+        per_core = {
+            f"cpu_core_{int(name[3:]) + 1}": value
+            for name, value in sorted(usage.items(), key=lambda item: int(item[0][3:]))
+        }
+        return total_usage, per_core
 
-    individual_full_path = os.path.join(monthly_path, f"{file_identifier}.json")
-    if not _write_json_with_retries(individual_full_path, data, is_general_json=False):
-        return False 
+    def read_memory(self):
+        """Total, usado e percentual de uso da RAM a partir de /proc/meminfo."""
+        values = {}
+        for line in self.read_file("proc/meminfo").splitlines():
+            key, _, rest = line.partition(":")
+            if key in ("MemTotal", "MemAvailable", "MemFree", "Buffers", "Cached"):
+                values[key] = int(rest.split()[0]) * 1024
+        total = values.get("MemTotal", 0)
+        available = values.get("MemAvailable")
+        if available is None:
+            available = values.get("MemFree", 0) + values.get("Buffers", 0) + values.get("Cached", 0)
+        used = total - available
+        return {
+            "total_gb": round(total / (1024**3), 2),
+            "usado_gb": round(used / (1024**3), 2),
+            "percentual_uso": round(100.0 * used / total, 1) if total else None
+        }
 
-    general_full_path = os.path.join(monthly_path, "dados_gerais_mensal.json")
-    return _write_json_with_retries(general_full_path, data, is_general_json=True)
+    def read_network(self, now):
+        """Totais e vazão por interface (exceto loopback) a partir de /proc/net/dev."""
+        counters = {}
+        for line in self.read_file("proc/net/dev").splitlines()[2:]:
+            name, _, rest = line.partition(":")
+            name = name.strip()
+            if not name or name == "lo":
+                continue
+            fields = rest.split()
+            counters[name] = (int(fields[0]), int(fields[8]))
+        rates = self._rates("rede", counters, now)
+        interfaces = {}
+        for name, (received, sent) in counters.items():
+            entry = {"recebido_mbps": None, "enviado_mbps": None}
+            if rates is not None and name in rates[0]:
+                previous_received, previous_sent = rates[0][name]
+                elapsed = rates[1]
+                if received >= previous_received and sent >= previous_sent:
+                    entry["recebido_mbps"] = round((received - previous_received) * 8 / 1_000_000 / elapsed, 2)
+                    entry["enviado_mbps"] = round((sent - previous_sent) * 8 / 1_000_000 / elapsed, 2)
+            interfaces[name] = entry
+        return counters, interfaces
 
+    def _whole_disk_names(self, names):
+        """
+        Discos inteiros (sem partições nem loop/ram/zram) entre os dispositivos de /proc/diskstats.
+        O conjunto é calculado uma vez e só refeito quando a lista de dispositivos muda (disco conectado ou removido).
+        """
+        if names != self._disk_names:
+            block_dir = self._path("sys", "block")
+            block_devices = set(os.listdir(block_dir)) if os.path.isdir(block_dir) else None
+            self._whole_disks = {
+                name for name in names
+                if not name.startswith(("loop", "ram", "zram")) and (block_devices is None or name in block_devices)
+            }
+            self._disk_names = names
+        return self._whole_disks
 
-# --- Execução principal do script ---
-if __name__ == '__main__':
-    load_configuration() 
+    def read_disks(self, now):
+        """IOPS, vazão, latência média por operação e utilização por disco a partir de /proc/diskstats."""
+        counters = {}
+        rows = [fields for fields in (line.split() for line in self.read_file("proc/diskstats").splitlines()) if len(fields) >= 14]
+        whole_disks = self._whole_disk_names(tuple(fields[2] for fields in rows))
+        for fields in rows:
+            if fields[2] not in whole_disks:
+                continue
+            values = [int(value) for value in fields[3:14]]
+            # leituras, setores lidos, ms lendo, escritas, setores escritos, ms escrevendo, ms com E/S
+            counters[fields[2]] = (values[0], values[2], values[3], values[4], values[6], values[7], values[9])
+        rates = self._rates("discos", counters, now)
+        disks = {}
+        for name, current in counters.items():
+            if rates is None or name not in rates[0]:
+                disks[name] = {}
+                continue
+            elapsed = rates[1]
+            delta = [value - previous for value, previous in zip(current, rates[0][name])]
+            if any(value < 0 for value in delta):
+                disks[name] = {}
+                continue
+            reads, sectors_read, ms_reading, writes, sectors_written, ms_writing, ms_io = delta
+            disks[name] = {
+                "leituras_s": round(reads / elapsed, 2),
+                "escritas_s": round(writes / elapsed, 2),
+                "leitura_mb_s": round(sectors_read * DISKSTATS_SECTOR_BYTES / (1024**2) / elapsed, 2),
+                "escrita_mb_s": round(sectors_written * DISKSTATS_SECTOR_BYTES / (1024**2) / elapsed, 2),
+                "latencia_leitura_ms": round(ms_reading / reads, 2) if reads else None,
+                "latencia_escrita_ms": round(ms_writing / writes, 2) if writes else None,
+                "utilizacao_percent": round(min(100.0, ms_io / (elapsed * 10)), 1)
+            }
+        return disks
+
+    def read_uptime_hours(self):
+        return round(float(self.read_file("proc/uptime").split()[0]) / 3600, 2)
+
+    def _discover_hwmon(self):
+        """Mapeia os sensores de temperatura: [(chip, rótulo, caminho relativo de temp*_input)]."""
+        inputs = []
+        hwmon_dir = os.path.join("sys", "class", "hwmon")
+        try:
+            entries = sorted(os.listdir(self._path(hwmon_dir)))
+        except OSError:
+            entries = []
+        for entry in entries:
+            device_dir = os.path.join(hwmon_dir, entry)
+            try:
+                chip = self.read_file(os.path.join(device_dir, "name")).strip()
+                self._close(os.path.join(device_dir, "name"))
+                file_names = sorted(os.listdir(self._path(device_dir)))
+            except OSError:
+                continue
+            for file_name in file_names:
+                if not (file_name.startswith("temp") and file_name.endswith("_input")):
+                    continue
+                sensor_id = file_name[:-len("_input")]
+                label_path = os.path.join(device_dir, f"{sensor_id}_label")
+                try:
+                    label = self.read_file(label_path).strip()
+                    self._close(label_path)
+                except OSError:
+                    label = sensor_id
+                inputs.append((chip, label, os.path.join(device_dir, file_name)))
+        self._hwmon_inputs = inputs
+        return inputs
+
+    def read_temperatures(self):
+        """Leituras de /sys/class/hwmon: [(chip, rótulo, graus Celsius)]."""
+        if self._hwmon_inputs is None:
+            self._discover_hwmon()
+        readings = []
+        failed = False
+        for chip, label, relative_path in self._hwmon_inputs:
+            try:
+                readings.append((chip, label, round(int(self.read_file(relative_path).strip()) / 1000, 2)))
+            except (OSError, ValueError):
+                failed = True
+        if failed:
+            # Um sensor sumiu ou mudou (módulo recarregado, disco removido): redescobre no próximo ciclo.
+            self._hwmon_inputs = None
+        return readings
+
+
+def parse_hwmon_temperatures(readings):
+    """Converte leituras do hwmon no mesmo formato de `monitoramento` usado pelo Open Hardware Monitor."""
+    monitoramento_data = _new_monitoramento_data()
+    core_temps = {}
+    board_temps = {}
+    disks = {}
+    for chip, label, value in readings:
+        label_key = _sensor_name_key(label)
+        if chip in HWMON_CPU_CHIPS:
+            monitoramento_data['cpu'].setdefault('nome', "CPU (Linux)")
+            if label_key.startswith("core_"):
+                core_temps[f"cpu_core_{int(label_key[5:]) + 1}" if label_key[5:].isdigit() else label_key] = value
+            elif label_key.startswith(("package", "tctl", "tdie")) or 'temperatura_package_celsius' not in monitoramento_data['cpu']:
+                monitoramento_data['cpu']['temperatura_package_celsius'] = value
+        elif chip in HWMON_GPU_CHIPS:
+            monitoramento_data['gpu'].setdefault('nome', chip)
+            if label_key in ("edge", "temp1") or 'temperatura_core_celsius' not in monitoramento_data['gpu']:
+                monitoramento_data['gpu']['temperatura_core_celsius'] = value
+        elif chip.startswith(HWMON_DISK_CHIPS):
+            disks.setdefault(chip, value)
+        else:
+            board_temps[f"{chip}_{label_key}"] = value
+    if core_temps:
+        monitoramento_data['cpu']['temperaturas_cores_celsius'] = core_temps
+    if board_temps:
+        monitoramento_data['placa_mae']['temperaturas_celsius'] = board_temps
+    for chip, value in disks.items():
+        monitoramento_data['discos_adicionais'].append({"nome": chip, "tipo": "HDD", "temperatura_celsius": value})
+    return monitoramento_data
+
+_procfs_reader = None
+
+def get_procfs_reader():
+    global _procfs_reader
+    if _procfs_reader is None:
+        _procfs_reader = ProcfsReader()
+    return _procfs_reader
+
+def collect_procfs(reader, now=None):
+    """CPU (total e por núcleo), memória, rede (total e por interface), E/S por disco e uptime a partir do procfs."""
+    now = time.monotonic() if now is None else now
+    monitoramento_data = _new_monitoramento_data()
+
+    total_usage, per_core = reader.read_cpu(now)
+    monitoramento_data['cpu']['percentual_uso'] = total_usage
+    if per_core:
+        monitoramento_data['cpu']['uso_nucleos_percent'] = per_core
+    monitoramento_data['memoria_ram'] = reader.read_memory()
+
+    counters, interfaces = reader.read_network(now)
+    received = sum(value[0] for value in counters.values())
+    sent = sum(value[1] for value in counters.values())
+    known_rates = [entry for entry in interfaces.values() if entry["recebido_mbps"] is not None]
+    monitoramento_data['rede'] = {
+        "bytes_enviados_mb": round(sent / (1024**2), 2),
+        "bytes_recebidos_mb": round(received / (1024**2), 2),
+        "velocidade_atual_mbps": round(sum(entry["recebido_mbps"] + entry["enviado_mbps"] for entry in known_rates), 2) if known_rates else None,
+        "interfaces": interfaces
+    }
+
+    disks = reader.read_disks(now)
+    monitoramento_data['discos_io'] = disks
+    read_rates = [disk["leitura_mb_s"] for disk in disks.values() if disk]
+    write_rates = [disk["escrita_mb_s"] for disk in disks.values() if disk]
+    monitoramento_data['disco_io'] = {
+        "leitura_mb_s": round(sum(read_rates), 2) if read_rates else None,
+        "escrita_mb_s": round(sum(write_rates), 2) if write_rates else None
+    }
+    monitoramento_data['uptime_horas'] = reader.read_uptime_hours()
+    return monitoramento_data
+
+def _collect_procfs(main_disk_path):
+    return collect_procfs(get_procfs_reader())
+
+def _collect_hwmon(main_disk_path):
+    """Temperaturas de CPU, GPU, discos e placa-mãe via /sys/class/hwmon (Linux)."""
+    return parse_hwmon_temperatures(get_procfs_reader().read_temperatures())
+
+def _merge_monitoramento(target, fragment):
+    """Mescla o fragmento de um coletor em `target` (dicionários são mesclados, listas concatenadas)."""
+    for key, value in fragment.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_monitoramento(target[key], value)
+        elif isinstance(value, list) and isinstance(target.get(key), list):
+            target[key].extend(value)
+        elif value is not None or key not in target:
+            target[key] = value
+
+def _com_initializer():
+    """Inicializa o COM na thread do coletor WMI (necessário para usar WMI fora da thread principal)."""
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()
+    except ImportError:
+        pass
+
+def _procfs_available():
+    missing = get_procfs_reader().missing_files()
+    if missing:
+        logging.warning(f"Leitura direta de /proc indisponível (sem acesso a {', '.join(missing)}). Usando psutil.")
+    return not missing
+
+def get_collectors():
+    """Retorna a lista de coletores (nome, função, inicializador da thread) disponíveis neste SO."""
+    use_procfs = platform.system() == "Linux" and LINUX_PROCFS_ENABLED and _procfs_available()
+    collectors = [
+        ("procfs", _collect_procfs, None) if use_procfs else ("psutil", _collect_psutil, None),
+        ("psutil_disco", _collect_psutil_disk, None),
+        ("psutil_inventario", _collect_psutil_inventory, None)
+    ]
+    if platform.system() == "Windows" and wmi is not None:
+        collectors.append(("ohm", _collect_ohm_sensors, _com_initializer))
+    elif use_procfs:
+        collectors.append(("hwmon", _collect_hwmon, None))
+    elif platform.system() == "Linux" and hasattr(psutil, "sensors_temperatures"):
+        collectors.append(("sensores_linux", _collect_linux_sensors, None))
+    else:
+        logging.info("Coleta detalhada de hardware (via Open Hardware Monitor) não suportada neste SO ou módulo WMI não disponível.")
+    if PROCESS_COLLECTOR_ENABLED:
+        collectors.append(("processos", _collect_processes, None))
+    return collectors
+
+# Um executor de uma thread por coletor: coletores lentos não atrasam os demais, e o coletor WMI
+# sempre roda na mesma thread (apartamento COM estável).
+_collector_executors = {}
+_collector_pending = {}
+
+def _timed_collector(name, function, main_disk_path):
+    with profiled(), stage_metrics.timed(f"coleta.{name}"):
+        return function(main_disk_path)
+
+def _submit_collector(name, function, initializer, main_disk_path):
+    """
+    Agenda o coletor no executor dele e retorna o Future.
+    Um coletor que estourou o tempo e ainda está rodando é pulado (retorna None), em vez de enfileirar chamadas.
+    """
+    pending = _collector_pending.get(name)
+    if pending is not None and not pending.done():
+        logging.warning(f"Coletor '{name}' ainda em execução desde o ciclo anterior. Pulando neste ciclo.")
+        return None
+    executor = _collector_executors.get(name)
+    if executor is None:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"coletor-{name}", initializer=initializer)
+        _collector_executors[name] = executor
+    future = executor.submit(_timed_collector, name, function, main_disk_path)
+    _collector_pending[name] = future
+    return future
+
+def _run_collectors(collectors, main_disk_path, timeout_seconds):
+    """
+    Executa os coletores em paralelo e aguarda cada um até `timeout_seconds`.
+    Retorna a lista de fragmentos coletados.
+    """
+    futures = []
+    for name, function, initializer in collectors:
+        future = _submit_collector(name, function, initializer, main_disk_path)
+        if future is not None:
+            futures.append((name, future))
+
+    fragments = []
+    deadline = time.monotonic() + timeout_seconds
+    for name, future in futures:
+        try:
+            fragments.append((name, future.result(timeout=max(0, deadline - time.monotonic()))))
+        except concurrent.futures.TimeoutError:
+            logging.warning(f"Coletor '{name}' excedeu {timeout_seconds}s. Dados omitidos neste ciclo.")
+        except Exception as e:
+            logging.error(f"Erro no coletor '{name}': {e}")
+    return fragments
+
+def get_hardware_data(timestamp=None):
+    """
+    Coleta os dados de hardware e sistema e os consolida em um único objeto.
+    `timestamp` (datetime) permite usar o horário agendado do ciclo em vez do horário atual.
+    """
     
-    logging.info("Iniciando o agente de monitoramento em modo de script.")
-    logging.info(f"Os dados serão salvos em: {os.path.abspath(SHARED_NETWORK_PATH)}")
+    final_data = {}
+    monitoramento_data = _new_monitoramento_data()
+    main_disk_path = 'C:\\' if platform.system() == "Windows" else '/'
+
+    try:
+        fragments = _run_collectors(get_collectors(), main_disk_path, COLLECTOR_TIMEOUT_SECONDS)
+        if not any(COLLECTOR_GROUPS.get(name) == "cpu_rede" for name, _ in fragments):
+            logging.error("Coletor de CPU e rede não retornou dados neste ciclo.")
+            return None
+        for _, fragment in fragments:
+            _merge_monitoramento(monitoramento_data, fragment)
+
+        final_data = _build_record(monitoramento_data, timestamp)
+
+    except Exception as e:
+        logging.error(f"Erro geral ao coletar dados de hardware: {e}")
+        return None
     
-    while True:
-        data = get_hardware_data()
-        if data:
-            write_data_to_files(data, SHARED_NETWORK_PATH)
-        else:
-            logging.error("Não foi possível coletar dados de hardware. Verifique o log para detalhes.")
-        
-        logging.info(f"Próxima coleta em {COLLECTION_INTERVAL_SECONDS} segundos...")
-        time.sleep(COLLECTION_INTERVAL_SECONDS)
\ No newline at end of file
+    return final_data
+
+def _build_record(monitoramento_data, timestamp=None):
+    final_data = {}
+    final_data['hostname'] = platform.node()
+    final_data['machine_alias'] = MACHINE_ALIAS if MACHINE_ALIAS else final_data['hostname']
+    collected_at = timestamp or datetime.datetime.now()
+    final_data['timestamp_coleta'] = collected_at.strftime(TIMESTAMP_FORMAT)
+    final_data['timestamp_epoch'] = int(collected_at.timestamp())
+    final_data['monitoramento'] = monitoramento_data
+    return final_data
+
+
+class MultiRateCollector:
+    """
+    Coleta cada grupo de métricas (COLLECTOR_GROUPS) no próprio intervalo e monta registros com os valores mais recentes.
+    `tick_interval` é o menor intervalo entre os grupos: a cada tick, `collect(horario)` agenda os grupos vencidos
+    (alinhados a múltiplos do intervalo do grupo no relógio de parede) e retorna um registro completo.
+    O tick espera apenas pelos grupos do intervalo mais curto; grupos mais lentos (ex.: WMI, disco) atualizam a tabela
+    de valores quando terminam e entram no próximo registro, sem atrasar a coleta rápida.
+    Todo registro repete os valores mais recentes dos grupos lentos: o custo de coleta cai, mas o tamanho do registro
+    só cai com DELTA_ENCODING, que grava entre as amostras completas apenas os campos alterados.
+    """
+
+    def __init__(self, collectors, group_intervals, default_interval, main_disk_path, timeout_seconds):
+        self.collectors = list(collectors)
+        self.main_disk_path = main_disk_path
+        self.timeout_seconds = timeout_seconds
+        self.intervals = {
+            name: group_intervals.get(COLLECTOR_GROUPS.get(name), default_interval)
+            for name, _, _ in self.collectors
+        }
+        self.tick_interval = min(self.intervals.values(), default=default_interval)
+        self._latest = {}
+        self._last_slot = {}
+        self._lock = threading.Lock()
+
+    def _store(self, name, future):
+        try:
+            fragment = future.result()
+        except Exception as e:
+            logging.error(f"Erro no coletor '{name}': {e}")
+            return
+        with self._lock:
+            self._latest[name] = fragment
+
+    def _slot(self, name, epoch):
+        return math.floor(epoch / self.intervals[name] + 1e-6)
+
+    def due_collectors(self, epoch):
+        """Coletores cujo grupo vence no horário `epoch` (cada slot de intervalo é coletado uma única vez)."""
+        return [
+            (name, function, initializer) for name, function, initializer in self.collectors
+            if self._last_slot.get(name) != self._slot(name, epoch)
+        ]
+
+    def collect(self, timestamp=None):
+        collected_at = timestamp or datetime.datetime.now()
+        epoch = collected_at.timestamp()
+        waited = []
+        for name, function, initializer in self.due_collectors(epoch):
+            future = _submit_collector(name, function, initializer, self.main_disk_path)
+            if future is None:
+                continue
+            self._last_slot[name] = self._slot(name, epoch)
+            with self._lock:
+                has_value = name in self._latest
+            if self.intervals[name] <= self.tick_interval or not has_value:
+                waited.append((name, future))
+            else:
+                future.add_done_callback(lambda done, name=name: self._store(name, done))
+
+        deadline = time.monotonic() + self.timeout_seconds
+        for name, future in waited:
+            try:
+                concurrent.futures.wait([future], timeout=max(0, deadline - time.monotonic()))
+            except Exception:
+                pass
+            if future.done():
+                self._store(name, future)
+            else:
+                logging.warning(f"Coletor '{name}' excedeu {self.timeout_seconds}s. Valores anteriores mantidos neste ciclo.")
+                future.add_done_callback(lambda done, name=name: self._store(name, done))
+
+        with self._lock:
+            if not any(COLLECTOR_GROUPS.get(name) == "cpu_rede" for name in self._latest):
+                logging.error("Coletor de CPU e rede ainda não retornou dados.")
+                return None
+            fragments = [self._latest[name] for name, _, _ in self.collectors if name in self._latest]
+            monitoramento_data = _new_monitoramento_data()
+            for fragment in fragments:
+                _merge_monitoramento(monitoramento_data, copy.deepcopy(fragment))
+        return _build_record(monitoramento_data, collected_at)
+
+# --- Bloqueio de arquivo com lease ---
+# O bloqueio é um lock de SO sobre o primeiro byte de '{arquivo}.lock' (fcntl no Linux, msvcrt e LockFileEx no Windows),
+# liberado automaticamente pelo SO se o processo morrer. O arquivo .lock nunca é apagado: um arquivo
+# deixado por um agente que travou não bloqueia ninguém. Depois do byte 0 o dono grava um lease
+# (máquina, pid, expiração) para diagnóstico. Sem fcntl/msvcrt, o lease é o próprio bloqueio:
+# o arquivo é criado com O_EXCL e um lease expirado é recuperado.
+LOCK_LEASE_SECONDS = 30
+LOCK_STATS_WINDOW = 1000  # Quantidade de esperas recentes usadas nos percentis
+
+_lock_stats_lock = threading.Lock()
+_lock_stats = {"aquisicoes": 0, "contencoes": 0, "timeouts": 0, "recuperacoes_lease": 0, "espera_total_s": 0.0, "espera_max_s": 0.0}
+_lock_wait_samples = collections.deque(maxlen=LOCK_STATS_WINDOW)
+
+# Locks de SO (fcntl) pertencem ao processo, não à thread: threads do mesmo processo
+# se excluem primeiro por este lock em memória, um por arquivo .lock.
+_process_locks = collections.defaultdict(threading.Lock)
+_process_locks_guard = threading.Lock()
+
+def _process_lock_for(lock_file_path):
+    with _process_locks_guard:
+        return _process_locks[os.path.abspath(lock_file_path)]
+
+def _record_lock_wait(wait_seconds, acquired, contended):
+    stage_metrics.record("lock.aquisicao", wait_seconds)
+    with _lock_stats_lock:
+        if acquired:
+            _lock_stats["aquisicoes"] += 1
+        else:
+            _lock_stats["timeouts"] += 1
+        if contended:
+            _lock_stats["contencoes"] += 1
+        _lock_stats["espera_total_s"] += wait_seconds
+        _lock_stats["espera_max_s"] = max(_lock_stats["espera_max_s"], wait_seconds)
+        _lock_wait_samples.append(wait_seconds)
+
+def get_lock_wait_stats():
+    """Estatísticas de espera por bloqueios de arquivo deste processo (contadores, p50/p95 recentes e máximo)."""
+    with _lock_stats_lock:
+        stats = dict(_lock_stats)
+        samples = sorted(_lock_wait_samples)
+    if samples:
+        stats["espera_p50_s"] = samples[len(samples) // 2]
+        stats["espera_p95_s"] = samples[max(0, math.ceil(0.95 * len(samples)) - 1)]
+    return stats
+
+def _lease_payload(lease_seconds):
+    return json.dumps({
+        "hostname": platform.node(),
+        "pid": os.getpid(),
+        "expira_em": time.time() + lease_seconds
+    }).encode('utf-8')
+
+def read_lock_lease(lock_file_path):
+    """Lê o lease gravado no arquivo .lock (dono e expiração), ou None se ausente/ilegível."""
+    try:
+        with open(lock_file_path, 'rb') as f:
+            content = f.read().lstrip(b'\x00').strip()
+        return json.loads(content) if content else None
+    except (OSError, ValueError):
+        return None
+
+
+class FileLock:
+    """Bloqueio exclusivo entre processos/máquinas para `file_path`, usando '{file_path}.lock'."""
+
+    def __init__(self, file_path, lease_seconds=LOCK_LEASE_SECONDS):
+        self.file_path = file_path
+        self.lock_file_path = file_path + ".lock"
+        self.lease_seconds = lease_seconds
+        self._fd = None
+        self._process_lock = None
+
+    # --- Backends de SO (fcntl/msvcrt) ---
+    def _os_try_lock(self, fd):
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 0)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, MSVCRT_LK_NBLCK, 1)
+
+    def _os_blocking_lock(self, fd):
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+        else:
+            _win_blocking_lock(fd)
+
+    def _os_unlock(self, fd):
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, MSVCRT_LK_UNLCK, 1)
+
+    def _write_lease(self, fd):
+        payload = _lease_payload(self.lease_seconds)
+        os.lseek(fd, 1, os.SEEK_SET)
+        os.write(fd, payload)
+        os.ftruncate(fd, 1 + len(payload))
+
+    def _acquire_os_lock(self, timeout_seconds, process_lock):
+        """
+        Retorna (adquirido, houve_contencao, lock_do_processo_transferido).
+        Se o timeout expirar com a espera ainda em andamento, `process_lock` passa a pertencer à thread
+        auxiliar, que só o libera depois de desistir ou de soltar o bloqueio e fechar o descritor: como
+        locks fcntl são do processo inteiro, nenhuma outra thread pode usar o arquivo .lock nesse meio tempo.
+        """
+        fd = os.open(self.lock_file_path, os.O_CREAT | os.O_RDWR)
+        try:
+            self._os_try_lock(fd)
+            self._fd = fd
+            return True, False, False
+        except OSError:
+            pass
+
+        # Contenção: espera bloqueante no SO em uma thread auxiliar, para respeitar o timeout.
+        # Se o timeout expirar, a thread libera o bloqueio assim que conseguir, fecha o descritor
+        # e só então libera o lock do processo.
+        state = {"adquirido": False, "abandonado": False, "terminado": False}
+        state_lock = threading.Lock()
+        done = threading.Event()
+        deadline = time.monotonic() + timeout_seconds
+
+        def _wait_for_lock():
+            acquired = False
+            while not acquired and time.monotonic() < deadline + self.lease_seconds:
+                try:
+                    self._os_blocking_lock(fd)
+                    acquired = True
+                except OSError:
+                    with state_lock:
+                        if state["abandonado"]:
+                            break
+            with state_lock:
+                if state["abandonado"]:
+                    try:
+                        if acquired:
+                            self._os_unlock(fd)
+                        os.close(fd)
+                    finally:
+                        process_lock.release()
+                else:
+                    state["adquirido"] = acquired
+                    if not acquired:
+                        os.close(fd)
+                state["terminado"] = True
+                done.set()
+
+        threading.Thread(target=_wait_for_lock, name="espera-lock", daemon=True).start()
+        done.wait(timeout_seconds)
+        with state_lock:
+            # Decidido pelo estado, sob o mesmo lock da thread auxiliar: se ela já registrou o
+            # resultado, ele vale mesmo que o wait acima tenha expirado.
+            if not state["terminado"]:
+                state["abandonado"] = True
+                return False, True, True
+            if state["adquirido"]:
+                self._fd = fd
+            return state["adquirido"], True, False
+
+    # --- Backend apenas com lease (sem fcntl/msvcrt) ---
+    def _acquire_lease_only(self, timeout_seconds, check_interval_seconds):
+        deadline = time.monotonic() + timeout_seconds
+        contended = False
+        interval = min(0.005, check_interval_seconds)
+        while True:
+            try:
+                fd = os.open(self.lock_file_path, os.O_CREAT | os.O_EXCL | os.O_RDWR)
+                os.write(fd, b'\x00' + _lease_payload(self.lease_seconds))
+                os.close(fd)
+                return True, contended
+            except FileExistsError:
+                contended = True
+                lease = read_lock_lease(self.lock_file_path)
+                expired = lease is not None and lease.get("expira_em", 0) < time.time()
+                if lease is None:
+                    # Lease ilegível (ex.: dono morreu no meio da escrita): usa a idade do arquivo.
+                    try:
+                        expired = time.time() - os.path.getmtime(self.lock_file_path) > self.lease_seconds
+                    except OSError:
+                        expired = False
+                if expired:
+                    self._reclaim_lease(lease)
+                    continue
+            if time.monotonic() >= deadline:
+                return False, contended
+            time.sleep(interval)
+            interval = min(interval * 2, check_interval_seconds)
+
+    def _reclaim_lease(self, stale_lease):
+        """Remove um lease expirado renomeando-o primeiro, para que apenas um processo o recupere."""
+        stale_path = f"{self.lock_file_path}.{os.getpid()}.{threading.get_ident()}.expirado"
+        try:
+            os.replace(self.lock_file_path, stale_path)
+            os.remove(stale_path)
+            with _lock_stats_lock:
+                _lock_stats["recuperacoes_lease"] += 1
+            logging.warning(f"Lease expirado de '{self.lock_file_path}' recuperado (dono anterior: {stale_lease}).")
+        except OSError:
+            pass
+
+    def acquire(self, timeout_seconds=10, check_interval_seconds=0.1):
+        started = time.monotonic()
+        process_lock = _process_lock_for(self.lock_file_path)
+        contended = not process_lock.acquire(blocking=False)
+        if contended and not process_lock.acquire(timeout=timeout_seconds):
+            _record_lock_wait(time.monotonic() - started, False, True)
+            return False
+        remaining = max(0, timeout_seconds - (time.monotonic() - started))
+        handed_off = False
+        try:
+            if fcntl is not None or msvcrt is not None:
+                acquired, os_contended, handed_off = self._acquire_os_lock(remaining, process_lock)
+                if acquired:
+                    self._write_lease(self._fd)
+            else:
+                acquired, os_contended = self._acquire_lease_only(remaining, check_interval_seconds)
+        except OSError as e:
+            logging.warning(f"Erro inesperado ao tentar adquirir bloqueio para '{self.lock_file_path}': {e}")
+            acquired, os_contended = False, False
+        if acquired:
+            self._process_lock = process_lock
+        elif not handed_off:
+            process_lock.release()
+        _record_lock_wait(time.monotonic() - started, acquired, contended or os_contended)
+        if acquired:
+            logging.debug(f"Bloqueio adquirido para: {self.lock_file_path}")
+        return acquired
+
+    def release(self):
+        try:
+            if self._fd is not None:
+                os.ftruncate(self._fd, 1)
+                self._os_unlock(self._fd)
+                os.close(self._fd)
+                self._fd = None
+            elif fcntl is None and msvcrt is None and os.path.exists(self.lock_file_path):
+                os.remove(self.lock_file_path)
+            logging.debug(f"Bloqueio liberado para: {self.lock_file_path}")
+        except OSError as e:
+            logging.error(f"Erro ao liberar bloqueio para '{self.lock_file_path}': {e}")
+        finally:
+            if self._process_lock is not None:
+                self._process_lock.release()
+                self._process_lock = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise TimeoutError(f"Não foi possível adquirir bloqueio para '{self.file_path}'.")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def acquire_file_lock(file_path, timeout_seconds=10, check_interval_seconds=0.1):
+    """
+    Adquire um bloqueio exclusivo para `file_path`, esperando até `timeout_seconds`.
+    Retorna o FileLock adquirido, ou None se o tempo esgotar.
+    """
+    lock = FileLock(file_path)
+    if lock.acquire(timeout_seconds, check_interval_seconds):
+        return lock
+    logging.error(f"Não foi possível adquirir bloqueio para '{file_path}' após {timeout_seconds} segundos.")
+    return None
+
+def release_file_lock(lock):
+    """Libera um bloqueio obtido com `acquire_file_lock`."""
+    lock.release()
+
+
+# --- Armazenamento append-only (JSON Lines) ---
+def record_epoch(record):
+    """Timestamp epoch (segundos) de um registro: 'timestamp_epoch' ou, em registros antigos, 'timestamp_coleta' convertido."""
+    epoch = record.get('timestamp_epoch')
+    if epoch is not None:
+        return epoch
+    return time.mktime(datetime.datetime.strptime(record['timestamp_coleta'], TIMESTAMP_FORMAT).timetuple())
+
+def _ensure_trailing_newline(file_full_path):
+    """
+    Garante que o arquivo termina em quebra de linha antes de um novo append.
+    Se a última escrita foi interrompida (linha "rasgada"), a linha parcial fica isolada
+    e é descartada pelo leitor, sem contaminar o próximo registro.
+    """
+    try:
+        size = os.path.getsize(file_full_path)
+    except OSError:
+        return
+    if size == 0:
+        return
+    with open(file_full_path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            f.seek(0, os.SEEK_END)
+            f.write(b'\n')
+            logging.warning(f"Última linha de '{file_full_path}' estava incompleta. Registro parcial isolado.")
+
+def serialize_jsonl_record(record):
+    """Serializa um registro como uma única linha JSON compacta (bytes UTF-8 terminados em '\\n')."""
+    return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+def append_jsonl_records(file_full_path, records, index_path=None, metrics_stage="jsonl"):
+    """
+    Acrescenta um ou mais registros ao final do arquivo .jsonl em uma única escrita.
+    O custo é constante por amostra: o conteúdo existente nunca é lido nem reescrito.
+    Com `index_path`, atualiza também o índice temporal do arquivo (ver `update_time_index`).
+    Os tempos de serialização e escrita são medidos com o sufixo `metrics_stage`.
+    """
+    with stage_metrics.timed(f"serializacao.{metrics_stage}"):
+        lines = [serialize_jsonl_record(r) for r in records]
+        payload = b''.join(lines)
+    with stage_metrics.timed(f"escrita.{metrics_stage}"):
+        _ensure_trailing_newline(file_full_path)
+        with open(file_full_path, 'ab') as f:
+            start_offset = f.tell()
+            f.write(payload)
+            f.flush()
+    if index_path is not None:
+        offsets = []
+        offset = start_offset
+        for record, line in zip(records, lines):
+            offsets.append((record_epoch(record), offset))
+            offset += len(line)
+        update_time_index(index_path, offsets)
+    return len(payload)
+
+def _compressed_extension(file_full_path):
+    for extension in COMPRESSION_FORMATS.values():
+        if file_full_path.endswith(extension):
+            return extension
+    return None
+
+def _open_decompressed(raw_file, extension):
+    if extension == ".gz":
+        return gzip.GzipFile(fileobj=raw_file, mode='rb')
+    if extension == ".xz":
+        return lzma.LZMAFile(raw_file, mode='rb')
+    return raw_file
+
+def data_file_parts(file_full_path):
+    """
+    Arquivos físicos de um arquivo '.jsonl': a parte compactada de um mês fechado ('.jsonl.gz'/'.jsonl.xz'),
+    se existir, seguida da parte ainda não compactada. Caminhos já compactados são retornados como estão.
+    """
+    if not file_full_path.endswith(".jsonl"):
+        return [file_full_path]
+    parts = [file_full_path + extension for extension in COMPRESSION_FORMATS.values() if os.path.exists(file_full_path + extension)]
+    if os.path.exists(file_full_path) or not parts:
+        parts.append(file_full_path)
+    return parts
+
+def read_jsonl_records(file_full_path):
+    """
+    Gera os registros de um arquivo .jsonl, um por linha, compactado ou não (ver `data_file_parts`).
+    A leitura é em fluxo: o arquivo nunca é carregado inteiro na memória.
+    Linhas vazias ou corrompidas (ex.: última linha truncada) são ignoradas com aviso.
+    """
+    for part_path in data_file_parts(file_full_path):
+        with open(part_path, 'rb') as raw_file, _open_decompressed(raw_file, _compressed_extension(part_path)) as f:
+            try:
+                for line_number, raw_line in enumerate(f, start=1):
+                    raw_line = raw_line.strip()
+                    if not raw_line:
+                        continue
+                    try:
+                        yield json.loads(raw_line)
+                    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                        logging.warning(f"Linha {line_number} de '{part_path}' ignorada (registro corrompido ou incompleto): {e}")
+            except (EOFError, OSError, lzma.LZMAError) as e:
+                logging.warning(f"Final de '{part_path}' ignorado (quadro compactado incompleto ou corrompido): {e}")
+
+# --- Índice temporal dos arquivos .jsonl ---
+# Arquivo '{arquivo}.jsonl.idx' ao lado de cada arquivo de máquina, com uma linha "inicio_do_bucket offset"
+# para o primeiro registro de cada bucket de INDEX_BUCKET_SECONDS. Permite ir direto ao trecho de um período.
+_index_last_bucket = {}
+
+def _time_bucket(epoch):
+    return int(epoch // INDEX_BUCKET_SECONDS) * INDEX_BUCKET_SECONDS
+
+def load_time_index(index_path):
+    """Lê o índice temporal como lista ordenada de (inicio_do_bucket, offset). Linhas inválidas são ignoradas."""
+    entries = []
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 2:
+                    continue
+                try:
+                    entries.append((int(parts[0]), int(parts[1])))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+def update_time_index(index_path, offsets):
+    """Registra no índice o offset do primeiro registro de cada bucket novo. `offsets` é uma lista de (epoch, offset)."""
+    last_bucket = _index_last_bucket.get(index_path)
+    if last_bucket is None:
+        entries = load_time_index(index_path)
+        last_bucket = entries[-1][0] if entries else -1
+    new_lines = []
+    for epoch, offset in offsets:
+        bucket = _time_bucket(epoch)
+        if bucket > last_bucket:
+            new_lines.append(f"{bucket} {offset}\n")
+            last_bucket = bucket
+    if new_lines:
+        _ensure_trailing_newline(index_path)
+        with open(index_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(new_lines))
+    _index_last_bucket[index_path] = last_bucket
+
+def query_records(file_full_path, start_epoch=None, end_epoch=None):
+    """
+    Gera os registros de um arquivo .jsonl (compactado ou não) com timestamp em [start_epoch, end_epoch].
+    Usa o índice '.idx' (se existir) para começar a leitura no bucket de `start_epoch`
+    e, nos arquivos de máquina, para de ler ao passar do bucket de `end_epoch`: o custo é proporcional
+    ao resultado, não ao mês. O arquivo geral não está em ordem de tempo (o merger acrescenta o trecho novo
+    de cada máquina em bloco e o spool entrega atrasos depois), então é lido até o fim.
+    """
+    time_ordered = not os.path.basename(file_full_path).startswith(GENERAL_FILE_BASENAME)
+    for part_path in data_file_parts(file_full_path):
+        yield from _query_part(part_path, start_epoch, end_epoch, time_ordered)
+
+def _query_part(file_full_path, start_epoch, end_epoch, time_ordered=True):
+    start_offset = 0
+    if start_epoch is not None:
+        file_size = os.path.getsize(file_full_path)
+        entries = [entry for entry in load_time_index(file_full_path + ".idx") if entry[1] <= file_size]
+        position = bisect.bisect_right(entries, (_time_bucket(start_epoch), file_size)) - 1
+        if position >= 0:
+            start_offset = entries[position][1]
+    # O índice só registra buckets maiores que todos os anteriores, então o salto inicial vale mesmo fora de ordem.
+    stop_epoch = _time_bucket(end_epoch) + INDEX_BUCKET_SECONDS if end_epoch is not None and time_ordered else None
+
+    with open(file_full_path, 'rb') as raw_file:
+        raw_file.seek(start_offset)
+        # Em arquivos compactados o offset é o início de um quadro, que é descompactado a partir dali.
+        with _open_decompressed(raw_file, _compressed_extension(file_full_path)) as f:
+            try:
+                for raw_line in f:
+                    raw_line = raw_line.strip()
+                    if not raw_line:
+                        continue
+                    try:
+                        record = json.loads(raw_line)
+                        epoch = record_epoch(record)
+                    except (json.JSONDecodeError, UnicodeDecodeError, KeyError, ValueError):
+                        continue
+                    if stop_epoch is not None and epoch >= stop_epoch:
+                        return
+                    if (start_epoch is None or epoch >= start_epoch) and (end_epoch is None or epoch <= end_epoch):
+                        yield record
+            except (EOFError, OSError, lzma.LZMAError) as e:
+                logging.warning(f"Final de '{file_full_path}' ignorado (quadro compactado incompleto ou corrompido): {e}")
+
+def export_jsonl_to_json_array(jsonl_path, json_path=None):
+    """
+    Exporta um arquivo .jsonl para o formato legado (array JSON com indent=4),
+    para consumidores que ainda esperam '{alias}.json' / 'dados_gerais_mensal.json'.
+    Os registros saem como amostras completas (ver `read_full_samples`), mesmo com DELTA_ENCODING.
+    Retorna o caminho do arquivo gerado.
+    """
+    if json_path is None:
+        extension = _compressed_extension(jsonl_path)
+        json_path = os.path.splitext(jsonl_path[:-len(extension)] if extension else jsonl_path)[0] + ".json"
+    tmp_path = json_path + ".tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write('[')
+        for record in read_full_samples(jsonl_path):
+            out.write(',\n' if count else '\n')
+            out.write(json.dumps(record, indent=4))
+            count += 1
+        out.write('\n]' if count else ']')
+    os.replace(tmp_path, json_path)
+    logging.info(f"{count} registros exportados de '{jsonl_path}' para '{json_path}'.")
+    return json_path
+
+
+# --- Formato colunar binário ---
+# Arquivo '{alias}.cols' por máquina e por mês, formado por blocos acrescentados ao final:
+#   cabeçalho do bloco: tipo (4 bytes) + tamanho do conteúdo (uint32, little-endian)
+#   'SCH1': JSON {id_da_coluna: "caminho.da.chave"} com as colunas novas
+#   'DAT1': n_linhas (uint32), n_colunas (uint16), ids das colunas (uint16 cada),
+#           timestamps epoch (float64 * n_linhas) e, para cada coluna, float64 * n_linhas (NaN = ausente)
+# Um bloco incompleto no final (escrita interrompida) é ignorado pelo leitor e sobrescrito na próxima escrita.
+COLUMNAR_MAGIC = b"10KKCOL1"
+# Só métricas de conjunto fixo viram colunas: chaves dinâmicas (interfaces, dispositivos, rankings de processos)
+# e listas criariam colunas novas sem limite, e os ids de coluna são uint16.
+COLUMNAR_EXCLUDED_PREFIXES = (
+    "monitoramento.rede.interfaces.",
+    "monitoramento.discos_io.",
+    "monitoramento.processos.",
+)
+COLUMNAR_MAX_COLUMNS = 4096
+_COLUMNAR_BLOCK_HEADER = struct.Struct("<4sI")
+_COLUMNAR_DATA_HEADER = struct.Struct("<IH")
+
+def flatten_numeric_fields(record, prefix="", include_lists=True):
+    """
+    Achata os valores numéricos de um registro em {"caminho.da.chave": valor}. Listas usam o índice no caminho,
+    ou são ignoradas com `include_lists=False`.
+    """
+    flat = {}
+    items = record.items() if isinstance(record, dict) else enumerate(record)
+    for key, value in items:
+        path = f"{prefix}{key}"
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            flat[path] = float(value)
+        elif isinstance(value, dict) or (include_lists and isinstance(value, list)):
+            flat.update(flatten_numeric_fields(value, path + ".", include_lists))
+    return flat
+
+def _scan_columnar_blocks(buffer):
+    """
+    Percorre os blocos completos de um arquivo colunar.
+    Gera (tipo, início_do_conteúdo, fim_do_conteúdo) e para no primeiro bloco incompleto.
+    """
+    if bytes(buffer[:len(COLUMNAR_MAGIC)]) != COLUMNAR_MAGIC:
+        raise ValueError("Arquivo colunar com cabeçalho inválido.")
+    position = len(COLUMNAR_MAGIC)
+    size = len(buffer)
+    while position + _COLUMNAR_BLOCK_HEADER.size <= size:
+        block_type, length = _COLUMNAR_BLOCK_HEADER.unpack_from(buffer, position)
+        start = position + _COLUMNAR_BLOCK_HEADER.size
+        if start + length > size:
+            break
+        yield block_type, start, start + length
+        position = start + length
+
+def columnar_fields(record):
+    """Métricas numéricas de um registro que vão para o formato colunar: sem listas nem COLUMNAR_EXCLUDED_PREFIXES."""
+    return {
+        path: value
+        for path, value in flatten_numeric_fields(record.get('monitoramento', {}), "monitoramento.", include_lists=False).items()
+        if not path.startswith(COLUMNAR_EXCLUDED_PREFIXES)
+    }
+
+# Esquema e tamanho válido (fim do último bloco completo) de cada arquivo colunar já aberto pelo agente.
+_columnar_states = {}
+
+def _load_columnar_state(file_full_path):
+    state = {"schema": {}, "end": len(COLUMNAR_MAGIC)}
+    if not os.path.exists(file_full_path) or os.path.getsize(file_full_path) == 0:
+        state["end"] = 0
+        return state
+    with open(file_full_path, 'rb') as f:
+        buffer = f.read()
+    for block_type, start, end in _scan_columnar_blocks(buffer):
+        if block_type == b"SCH1":
+            for column_id, path in json.loads(buffer[start:end].decode('utf-8')).items():
+                state["schema"][path] = int(column_id)
+        state["end"] = end
+    return state
+
+def append_columnar_records(file_full_path, records):
+    """
+    Acrescenta um lote de registros ao arquivo colunar como um bloco de dados
+    (precedido de um bloco de esquema se surgirem colunas novas). Retorna o número de bytes escritos.
+    """
+    state = _columnar_states.get(file_full_path)
+    if state is None:
+        state = _load_columnar_state(file_full_path)
+        _columnar_states[file_full_path] = state
+
+    flat_records = [columnar_fields(record) for record in records]
+    timestamps = [record_epoch(record) for record in records]
+
+    schema = state["schema"]
+    new_columns = {}
+    dropped = set()
+    for flat in flat_records:
+        for path in list(flat):
+            if path in schema:
+                continue
+            if len(schema) >= COLUMNAR_MAX_COLUMNS:
+                dropped.add(path)
+                del flat[path]
+                continue
+            schema[path] = len(schema)
+            new_columns[schema[path]] = path
+    if dropped and not state.get("limite_avisado"):
+        state["limite_avisado"] = True
+        logging.warning(f"Arquivo colunar '{file_full_path}' atingiu {COLUMNAR_MAX_COLUMNS} colunas. {len(dropped)} métricas novas ignoradas.")
+
+    payload = bytearray()
+    if state["end"] == 0:
+        payload += COLUMNAR_MAGIC
+    if new_columns:
+        schema_bytes = json.dumps(new_columns, ensure_ascii=False).encode('utf-8')
+        payload += _COLUMNAR_BLOCK_HEADER.pack(b"SCH1", len(schema_bytes)) + schema_bytes
+
+    used_columns = sorted({schema[path] for flat in flat_records for path in flat})
+    paths_by_id = {column_id: path for path, column_id in schema.items()}
+    nan = float("nan")
+    data = bytearray(_COLUMNAR_DATA_HEADER.pack(len(records), len(used_columns)))
+    data += array.array('H', used_columns).tobytes()
+    data += array.array('d', timestamps).tobytes()
+    for column_id in used_columns:
+        path = paths_by_id[column_id]
+        data += array.array('d', (flat.get(path, nan) for flat in flat_records)).tobytes()
+    payload += _COLUMNAR_BLOCK_HEADER.pack(b"DAT1", len(data)) + data
+
+    try:
+        with stage_metrics.timed("escrita.colunar"), open(file_full_path, 'r+b' if state["end"] else 'wb') as f:
+            # Posiciona no fim do último bloco completo, descartando um bloco incompleto de uma escrita interrompida.
+            f.seek(state["end"])
+            f.write(payload)
+            f.truncate()
+    except Exception:
+        _columnar_states.pop(file_full_path, None)
+        raise
+    state["end"] += len(payload)
+    return len(payload)
+
+
+class ColumnarReader:
+    """
+    Leitor de arquivos colunares ('.cols'). O arquivo é mapeado em memória e apenas os cabeçalhos
+    dos blocos são percorridos na abertura; os valores são lidos só para as colunas pedidas.
+    """
+
+    def __init__(self, file_full_path):
+        self.file_full_path = file_full_path
+        self._file = open(file_full_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.columns = {}
+        self._blocks = []
+        for block_type, start, end in _scan_columnar_blocks(self._mmap):
+            if block_type == b"SCH1":
+                for column_id, path in json.loads(self._mmap[start:end].decode('utf-8')).items():
+                    self.columns[path] = int(column_id)
+            elif block_type == b"DAT1":
+                n_rows, n_cols = _COLUMNAR_DATA_HEADER.unpack_from(self._mmap, start)
+                ids_start = start + _COLUMNAR_DATA_HEADER.size
+                column_ids = array.array('H')
+                column_ids.frombytes(self._mmap[ids_start:ids_start + 2 * n_cols])
+                timestamps_start = ids_start + 2 * n_cols
+                self._blocks.append((n_rows, list(column_ids), timestamps_start))
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_doubles(self, start, count):
+        values = array.array('d')
+        values.frombytes(self._mmap[start:start + 8 * count])
+        return values
+
+    def read(self, metrics, start=None, end=None, as_numpy=False):
+        """
+        Retorna {"timestamp": [...], metrica: [...]} para as métricas (caminhos de chave) pedidas,
+        com amostras no intervalo epoch [start, end]. Valores ausentes são NaN.
+        Com `as_numpy=True` (e NumPy instalado) retorna arrays NumPy.
+        """
+        unknown = [metric for metric in metrics if metric not in self.columns]
+        if unknown:
+            raise KeyError(f"Métricas inexistentes em '{self.file_full_path}': {unknown}")
+
+        result = {"timestamp": array.array('d')}
+        for metric in metrics:
+            result[metric] = array.array('d')
+        nan = float("nan")
+
+        for n_rows, column_ids, timestamps_start in self._blocks:
+            timestamps = self._read_doubles(timestamps_start, n_rows)
+            if (start is not None and timestamps[-1] < start) or (end is not None and timestamps[0] > end):
+                continue
+            selected = [i for i, ts in enumerate(timestamps) if (start is None or ts >= start) and (end is None or ts <= end)]
+            result["timestamp"].extend(timestamps[i] for i in selected)
+            for metric in metrics:
+                column_id = self.columns[metric]
+                if column_id in column_ids:
+                    column_start = timestamps_start + 8 * n_rows * (1 + column_ids.index(column_id))
+                    values = self._read_doubles(column_start, n_rows)
+                    result[metric].extend(values[i] for i in selected)
+                else:
+                    result[metric].extend(nan for _ in selected)
+
+        if as_numpy and numpy is not None:
+            return {key: numpy.frombuffer(values, dtype=numpy.float64) for key, values in result.items()}
+        return {key: values.tolist() for key, values in result.items()}
+
+
+# --- Codificação delta (somente mudanças) ---
+# Com DELTA_ENCODING, os campos estáticos (nomes, núcleos, capacidades) vão para 'inventario/{apelido}.jsonl',
+# gravado só quando mudam, e o arquivo da máquina recebe registros "completos" (keyframes) no início de cada
+# bucket do índice temporal e, entre eles, registros "_delta" apenas com os valores que mudaram.
+# Como cada bucket começa com um keyframe, `query_records` continua podendo pular direto para um período.
+STATIC_FIELDS = {
+    "cpu": ("nome", "nucleos_fisicos", "nucleos_logicos"),
+    "memoria_ram": ("total_gb",),
+    "disco_principal": ("nome", "total_gb"),
+    "gpu": ("nome", "tipo"),
+    "placa_mae": ("nome",),
+}
+STATIC_DISK_FIELDS = ("nome", "tipo")
+RECORD_IDENTITY_FIELDS = ("hostname", "machine_alias", "timestamp_coleta", "timestamp_epoch")
+
+def split_static_fields(record):
+    """Separa um registro em (inventario, registro_sem_campos_estaticos). O registro original não é alterado."""
+    monitoramento = record.get('monitoramento', {})
+    inventory_monitoramento = {}
+    volatile_monitoramento = {}
+    for section, value in monitoramento.items():
+        if section in STATIC_FIELDS and isinstance(value, dict):
+            static_keys = STATIC_FIELDS[section]
+            static_part = {key: value[key] for key in static_keys if key in value}
+            if static_part:
+                inventory_monitoramento[section] = static_part
+            volatile_monitoramento[section] = {key: item for key, item in value.items() if key not in static_keys}
+        elif section == "discos_adicionais" and isinstance(value, list):
+            inventory_monitoramento[section] = [{key: disk[key] for key in STATIC_DISK_FIELDS if key in disk} for disk in value]
+            volatile_monitoramento[section] = [{key: item for key, item in disk.items() if key not in STATIC_DISK_FIELDS} for disk in value]
+        else:
+            volatile_monitoramento[section] = value
+    inventory = {"hostname": record.get("hostname"), "machine_alias": record.get("machine_alias"), "monitoramento": inventory_monitoramento}
+    volatile = {key: value for key, value in record.items() if key != 'monitoramento'}
+    volatile['monitoramento'] = volatile_monitoramento
+    return inventory, volatile
+
+def merge_static_fields(volatile, inventory):
+    """Recompõe um registro completo a partir do registro sem campos estáticos e do inventário."""
+    record = copy.deepcopy(volatile)
+    monitoramento = record.setdefault('monitoramento', {})
+    for section, static_part in inventory.get('monitoramento', {}).items():
+        if section == "discos_adicionais":
+            disks = monitoramento.setdefault(section, [])
+            for position, static_disk in enumerate(static_part):
+                if position < len(disks):
+                    disks[position] = {**static_disk, **disks[position]}
+        else:
+            monitoramento[section] = {**static_part, **monitoramento.get(section, {})}
+    return record
+
+def _dict_delta(previous, current, path, removed):
+    """Subárvore de `current` com apenas o que difere de `previous`. Listas são comparadas inteiras."""
+    delta = {}
+    for key, value in current.items():
+        if key not in previous:
+            delta[key] = value
+        elif isinstance(value, dict) and isinstance(previous[key], dict):
+            sub_delta = _dict_delta(previous[key], value, path + [key], removed)
+            if sub_delta:
+                delta[key] = sub_delta
+        elif value != previous[key]:
+            delta[key] = value
+    for key in previous:
+        if key not in current:
+            removed.append(path + [key])
+    return delta
+
+def _apply_dict_delta(base, delta):
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _apply_dict_delta(base[key], value)
+        else:
+            base[key] = copy.deepcopy(value)
+
+
+class DeltaEncoder:
+    """
+    Mantém, por arquivo de máquina, o último registro gravado e o último inventário,
+    para gerar keyframes e deltas. Em falha de escrita, `reset` força um keyframe na próxima gravação.
+    """
+
+    def __init__(self):
+        self._states = {}
+
+    def reset(self, file_full_path):
+        self._states.pop(file_full_path, None)
+
+    def encode(self, file_full_path, records):
+        """Retorna (registros_codificados, inventarios_novos) para um lote de registros em ordem."""
+        state = self._states.setdefault(file_full_path, {"anterior": None, "bucket": None, "inventario": None})
+        encoded = []
+        inventories = []
+        for record in records:
+            inventory, volatile = split_static_fields(record)
+            epoch = record_epoch(record)
+            if inventory['monitoramento'] != state["inventario"]:
+                inventories.append({"timestamp_epoch": epoch, **inventory})
+                state["inventario"] = inventory['monitoramento']
+                state["anterior"] = None
+
+            bucket = _time_bucket(epoch)
+            if state["anterior"] is None or bucket != state["bucket"]:
+                encoded.append(volatile)
+            else:
+                removed = []
+                delta = _dict_delta(state["anterior"]['monitoramento'], volatile['monitoramento'], [], removed)
+                delta_record = {key: volatile[key] for key in RECORD_IDENTITY_FIELDS if key in volatile}
+                delta_record['_delta'] = True
+                delta_record['monitoramento'] = delta
+                if removed:
+                    delta_record['_removidos'] = removed
+                encoded.append(delta_record)
+            state["anterior"] = volatile
+            state["bucket"] = bucket
+        return encoded, inventories
+
+
+_delta_encoder = DeltaEncoder()
+
+def load_inventories(monthly_path):
+    """Lê 'inventario/*.jsonl' do diretório mensal como {apelido: [(epoch, inventario), ...]} em ordem de tempo."""
+    inventories = {}
+    inventory_dir = os.path.join(monthly_path, INVENTORY_DIR_NAME)
+    if not os.path.isdir(inventory_dir):
+        return inventories
+    for name in os.listdir(inventory_dir):
+        if not name.endswith((".jsonl", *(".jsonl" + extension for extension in COMPRESSION_FORMATS.values()))):
+            continue
+        for inventory in read_jsonl_records(os.path.join(inventory_dir, name)):
+            alias = inventory.get('machine_alias') or inventory.get('hostname')
+            inventories.setdefault(alias, []).append((inventory.get('timestamp_epoch', 0), inventory))
+    for entries in inventories.values():
+        entries.sort(key=lambda entry: entry[0])
+    return inventories
+
+def decode_samples(records, inventories):
+    """
+    Recompõe amostras completas a partir de registros keyframe/delta (de uma ou várias máquinas)
+    e dos inventários de `load_inventories`. Registros já completos passam sem alteração.
+    Deltas sem um keyframe anterior da mesma máquina são ignorados.
+    """
+    previous_by_alias = {}
+    for record in records:
+        alias = record.get('machine_alias') or record.get('hostname')
+        if record.get('_delta'):
+            previous = previous_by_alias.get(alias)
+            if previous is None:
+                continue
+            volatile = copy.deepcopy(previous)
+            for key in RECORD_IDENTITY_FIELDS:
+                if key in record:
+                    volatile[key] = record[key]
+            _apply_dict_delta(volatile['monitoramento'], record.get('monitoramento', {}))
+            for removed_path in record.get('_removidos', []):
+                container = volatile['monitoramento']
+                for key in removed_path[:-1]:
+                    container = container.get(key, {})
+                container.pop(removed_path[-1], None)
+        else:
+            volatile = record
+        previous_by_alias[alias] = volatile
+
+        alias_inventories = inventories.get(alias)
+        if not alias_inventories:
+            yield volatile
+            continue
+        position = bisect.bisect_right([epoch for epoch, _ in alias_inventories], record_epoch(volatile)) - 1
+        yield merge_static_fields(volatile, alias_inventories[max(position, 0)][1])
+
+def read_full_samples(file_full_path, start_epoch=None, end_epoch=None):
+    """Gera amostras completas de um arquivo de máquina ou geral, com ou sem codificação delta."""
+    inventories = load_inventories(os.path.dirname(file_full_path))
+    # A leitura começa no início do bucket de `start_epoch`, onde está o keyframe de que os deltas dependem.
+    bucket_start = _time_bucket(start_epoch) if start_epoch is not None else None
+    for sample in decode_samples(query_records(file_full_path, bucket_start, end_epoch), inventories):
+        if start_epoch is None or record_epoch(sample) >= start_epoch:
+            yield sample
+
+
+def write_data_to_files(data, base_path):
+    """
+    Escreve os dados coletados em:
+    1. O arquivo individual da máquina.
+    2. O arquivo geral mensal (um único arquivo por mês).
+    No formato 'jsonl' cada amostra é uma linha acrescentada ao final do arquivo;
+    no formato 'json' (legado) o array inteiro é lido e reescrito.
+    Implementa retries com backoff e um bloqueio de arquivo simples.
+    """
+    if not data:
+        logging.error("Dados vazios para escrita. Não será salvo.")
+        return False
+    return write_records_to_files([data], base_path)
+
+
+def write_records_to_files(records, base_path, month_folder=None, max_retries=MAX_RETRIES, targets=None):
+    """
+    Escreve um lote de amostras no diretório mensal `month_folder` (padrão: mês atual),
+    com uma única abertura/escrita por arquivo de destino para todo o lote.
+    `targets` restringe a escrita a parte dos arquivos: "maquina" (arquivo da máquina, inventário e colunar)
+    e/ou "geral" (arquivo geral, quando SHARDED_STORAGE está desligado). Padrão: todos.
+    """
+    if not records:
+        return True
+
+    if month_folder is None:
+        month_folder = datetime.datetime.now().strftime("%Y-%m")
+    monthly_path = os.path.join(base_path, month_folder)
+
+    if not os.path.exists(monthly_path):
+        try:
+            os.makedirs(monthly_path, exist_ok=True)
+            logging.info(f"Pasta mensal '{monthly_path}' criada com sucesso.")
+        except OSError as e:
+            logging.error(f"Erro ao criar pasta mensal '{monthly_path}': {e}")
+            return False
+
+    records_by_identifier = {}
+    for record in records:
+        file_identifier = record.get('machine_alias', record['hostname'])
+        records_by_identifier.setdefault(file_identifier, []).append(record)
+    
+    def _write_json_with_retries(file_full_path, records_to_append, is_general_json=False, use_lock=True):
+        index_path = None if is_general_json else file_full_path + ".idx"
+        current_backoff = INITIAL_BACKOFF_SECONDS
+        for attempt in range(max_retries):
+            file_lock = None
+            try:
+                if use_lock:
+                    file_lock = acquire_file_lock(file_full_path, timeout_seconds=INITIAL_BACKOFF_SECONDS)
+                    if file_lock is None:
+                        raise Exception("Não foi possível adquirir o bloqueio de arquivo.")
+
+                if STORAGE_FORMAT == "jsonl":
+                    append_jsonl_records(file_full_path, records_to_append, index_path=index_path)
+                    logging.info(f"JSONL {'geral' if is_general_json else 'individual'} '{file_full_path}' atualizado com sucesso na tentativa {attempt + 1} ({len(records_to_append)} registros).")
+                    return True
+
+                content_list = []
+                
+                if os.path.exists(file_full_path):
+                    with stage_metrics.timed("leitura_json"), open(file_full_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                        if content:
+                            try:
+                                content_list = json.loads(content)
+                                if not isinstance(content_list, list):
+                                    # Se não for uma lista, considera corrompido ou formato inesperado.
+                                    # Não sobrescreve, apenas loga e falha esta tentativa para retry.
+                                    raise ValueError(f"Conteúdo de JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' não é uma lista. Possivelmente corrompido ou formato inesperado.")
+                            except json.JSONDecodeError as e:
+                                # JSON está malformado. Loga e falha esta tentativa para retry.
+                                raise json.JSONDecodeError(f"JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' corrompido: {e}", e.doc, e.pos)
+                            except Exception as e:
+                                # Outros erros inesperados na leitura. Loga e falha esta tentativa para retry.
+                                raise Exception(f"Erro inesperado ao ler JSON {'geral' if is_general_json else 'individual'} '{file_full_path}': {e}")
+                
+                content_list.extend(records_to_append) 
+                
+                # Escreve o JSON atualizado
+                with stage_metrics.timed("escrita.json"), open(file_full_path, 'w', encoding='utf-8') as f:
+                    json.dump(content_list, f, indent=4)
+                
+                logging.info(f"JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' atualizado com sucesso na tentativa {attempt + 1}.")
+                return True
+
+            except (json.JSONDecodeError, ValueError, Exception) as e:
+                # Capture os erros de JSONDecodeError, ValueError (formato) e outros erros
+                # Aumente o nível do log para ERROR para esses casos, para indicar um problema
+                # persistente que impede a escrita dos dados.
+                log_message = f"Não foi possível processar JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' na tentativa {attempt + 1}/{max_retries}: {e}. O arquivo existente NÃO será sobrescrito. Tentando novamente em {current_backoff:.2f} segundos."
+                if attempt == max_retries - 1: # Se for a última tentativa, loga como ERROR
+                    logging.error(log_message)
+                else:
+                    logging.warning(log_message)
+            finally:
+                if file_lock is not None:
+                    release_file_lock(file_lock)
+            
+            if attempt == max_retries - 1:
+                break
+            sleep_time = current_backoff + random.uniform(0, current_backoff * 0.1) 
+            time.sleep(min(sleep_time, MAX_BACKOFF_SECONDS))
+            current_backoff *= 2 
+            
+        logging.error(f"Falha CRÍTICA ao atualizar JSON {'geral' if is_general_json else 'individual'} '{file_full_path}' após {max_retries} tentativas. Os dados não foram salvos e o arquivo original (corrompido ou não) foi mantido.")
+        return False
+
+    # --- Chamadas das funções auxiliares ---
+
+    extension = ".jsonl" if STORAGE_FORMAT == "jsonl" else ".json"
+
+    write_individual = targets is None or "maquina" in targets
+    write_general = not SHARDED_STORAGE and (targets is None or "geral" in targets)
+
+    for file_identifier, identifier_records in (records_by_identifier.items() if write_individual else ()):
+        individual_full_path = os.path.join(monthly_path, f"{file_identifier}{extension}")
+        individual_records = identifier_records
+
+        if DELTA_ENCODING:
+            individual_records, inventories = _delta_encoder.encode(individual_full_path, identifier_records)
+            if inventories:
+                inventory_path = os.path.join(monthly_path, INVENTORY_DIR_NAME)
+                try:
+                    os.makedirs(inventory_path, exist_ok=True)
+                    append_jsonl_records(os.path.join(inventory_path, f"{file_identifier}.jsonl"), inventories)
+                except OSError as e:
+                    logging.error(f"Erro ao gravar inventário da máquina '{file_identifier}' em '{inventory_path}': {e}")
+                    _delta_encoder.reset(individual_full_path)
+                    return False
+
+        if SHARDED_STORAGE:
+            # O arquivo da máquina só é escrito por ela mesma: nenhum bloqueio entre máquinas é necessário.
+            # O arquivo geral é consolidado separadamente pelo modo merger (--merger).
+            written = _write_json_with_retries(individual_full_path, individual_records, is_general_json=False, use_lock=False)
+        else:
+            written = _write_json_with_retries(individual_full_path, individual_records, is_general_json=False)
+        if not written:
+            if DELTA_ENCODING:
+                _delta_encoder.reset(individual_full_path)
+            return False 
+
+    if write_general:
+        general_full_path = os.path.join(monthly_path, f"{GENERAL_FILE_BASENAME}{extension}")
+        if not _write_json_with_retries(general_full_path, records, is_general_json=True):
+            return False
+
+    if COLUMNAR_STORAGE and write_individual:
+        for file_identifier, identifier_records in records_by_identifier.items():
+            columnar_full_path = os.path.join(monthly_path, f"{file_identifier}.cols")
+            try:
+                append_columnar_records(columnar_full_path, identifier_records)
+            except Exception as e:
+                # O formato colunar é complementar: uma falha aqui não invalida a escrita principal.
+                logging.error(f"Erro ao gravar arquivo colunar '{columnar_full_path}': {e}")
+
+    return True
+
+
+# --- Agregados (rollups) por minuto, hora e dia ---
+ROLLUP_LEVELS = ("minuto", "hora", "dia")
+
+# Métricas agregadas: caminhos exatos e, para sensores, qualquer caminho com os trechos abaixo.
+ROLLUP_FIELDS = (
+    "monitoramento.cpu.percentual_uso",
+    "monitoramento.cpu.uso_total_percent",
+    "monitoramento.memoria_ram.usado_gb",
+    "monitoramento.memoria_ram.percentual_uso",
+    "monitoramento.disco_principal.usado_gb",
+    "monitoramento.disco_principal.percentual_uso",
+    "monitoramento.disco_io.leitura_mb_s",
+    "monitoramento.disco_io.escrita_mb_s",
+    "monitoramento.rede.velocidade_atual_mbps",
+    "monitoramento.gpu.uso_percentual",
+)
+ROLLUP_FIELD_PATTERNS = ("temperatura",)
+
+def _is_rollup_field(path):
+    return path in ROLLUP_FIELDS or any(pattern in path for pattern in ROLLUP_FIELD_PATTERNS)
+
+def _rollup_window_start(level, epoch):
+    moment = datetime.datetime.fromtimestamp(epoch)
+    if level == "minuto":
+        moment = moment.replace(second=0, microsecond=0)
+    elif level == "hora":
+        moment = moment.replace(minute=0, second=0, microsecond=0)
+    else:
+        moment = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment
+
+def _summarize(values):
+    ordered = sorted(values)
+    p95_index = max(0, math.ceil(0.95 * len(ordered)) - 1)
+    return {
+        "min": ordered[0],
+        "max": ordered[-1],
+        "media": round(sum(ordered) / len(ordered), 2),
+        "p95": ordered[p95_index]
+    }
+
+
+class RollupAccumulator:
+    """
+    Acumula as métricas numéricas das amostras em janelas de minuto, hora e dia (horário local).
+    `add` retorna os agregados das janelas que fecharam com a nova amostra, como lista de (nivel, registro).
+    Com `journal_path`, cada amostra (só os campos agregados) e cada janela fechada são anotadas em um arquivo
+    local, zerado quando o dia fecha; ao iniciar, o diário é relido e as janelas abertas voltam como estavam,
+    então um reinício ou uma máquina desligada à noite não perdem a hora nem o dia correntes.
+    """
+
+    def __init__(self, levels=ROLLUP_LEVELS, journal_path=None):
+        self.levels = levels
+        self._windows = {level: None for level in levels}
+        self.journal_path = journal_path
+        if journal_path is not None:
+            self._restore()
+
+    def add(self, record):
+        epoch = record_epoch(record)
+        flat = {
+            path: value
+            for path, value in flatten_numeric_fields(record.get('monitoramento', {}), "monitoramento.").items()
+            if _is_rollup_field(path)
+        }
+        identity = {"hostname": record.get("hostname"), "machine_alias": record.get("machine_alias")}
+        closed = self._add_values(epoch, identity, flat)
+        self._journal(closed, {"timestamp_epoch": epoch, **identity, "valores": flat})
+        return closed
+
+    def _add_values(self, epoch, identity, flat):
+        closed = []
+        for level in self.levels:
+            window_start = _rollup_window_start(level, epoch)
+            window = self._windows[level]
+            if window is not None and window["inicio"] != window_start:
+                closed.append((level, self._close(level, window)))
+                window = None
+            if window is None:
+                window = {"inicio": window_start, "amostras": 0, "valores": {}, "origem": identity}
+                self._windows[level] = window
+            window["amostras"] += 1
+            window["origem"] = identity
+            for path, value in flat.items():
+                window["valores"].setdefault(path, array.array('d')).append(value)
+        return closed
+
+    def flush_expired(self, now=None):
+        """
+        Fecha e retorna as janelas cujo período já terminou no relógio de parede (ex.: ao iniciar depois de a
+        máquina ficar desligada, ou no encerramento). Janelas ainda em curso continuam abertas no diário.
+        """
+        now = time.time() if now is None else now
+        closed = []
+        for level in self.levels:
+            window = self._windows[level]
+            if window is not None and window["inicio"] != _rollup_window_start(level, now):
+                closed.append((level, self._close(level, window)))
+                self._windows[level] = None
+        self._journal(closed)
+        return closed
+
+    def flush(self):
+        """Fecha e retorna todas as janelas abertas, mesmo as em curso."""
+        closed = []
+        for level in self.levels:
+            window = self._windows[level]
+            if window is not None and window["amostras"]:
+                closed.append((level, self._close(level, window)))
+            self._windows[level] = None
+        self._journal(closed)
+        return closed
+
+    def _journal(self, closed, sample=None):
+        """Anota as janelas fechadas e a amostra nova. Quando o dia fecha, o diário recomeça só com a amostra."""
+        if self.journal_path is None or (not closed and sample is None):
+            return
+        entries = [{"fechada": level, "inicio": rollup["timestamp_epoch"]} for level, rollup in closed]
+        if sample is not None:
+            entries.append(sample)
+        try:
+            if any(level == self.levels[-1] for level, _ in closed):
+                tmp_path = self.journal_path + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(b''.join(serialize_jsonl_record(entry) for entry in entries if entry is sample))
+                os.replace(tmp_path, self.journal_path)
+            else:
+                append_jsonl_records(self.journal_path, entries, metrics_stage="rollups.diario")
+        except OSError as e:
+            logging.error(f"Erro ao gravar o diário de agregados '{self.journal_path}': {e}")
+
+    def _restore(self):
+        """Refaz as janelas abertas a partir do diário, descartando as que já tinham sido fechadas e gravadas."""
+        if not os.path.exists(self.journal_path):
+            return
+        closed_until = {}
+        samples = 0
+        for entry in read_jsonl_records(self.journal_path):
+            if "fechada" in entry:
+                closed_until[entry["fechada"]] = max(closed_until.get(entry["fechada"], entry["inicio"]), entry["inicio"])
+                continue
+            try:
+                identity = {"hostname": entry.get("hostname"), "machine_alias": entry.get("machine_alias")}
+                self._add_values(entry["timestamp_epoch"], identity, entry.get("valores", {}))
+                samples += 1
+            except (KeyError, TypeError, ValueError):
+                continue
+        for level in self.levels:
+            window = self._windows[level]
+            if window is not None and level in closed_until and window["inicio"].timestamp() <= closed_until[level]:
+                self._windows[level] = None
+        logging.info(f"Diário de agregados '{self.journal_path}' relido: {samples} amostras.")
+
+    def _close(self, level, window):
+        source = window["origem"]
+        return {
+            "hostname": source.get("hostname"),
+            "machine_alias": source.get("machine_alias"),
+            "nivel": level,
+            "inicio": window["inicio"].strftime(TIMESTAMP_FORMAT),
+            "timestamp_epoch": int(window["inicio"].timestamp()),
+            "amostras": window["amostras"],
+            "metricas": {path: _summarize(values) for path, values in window["valores"].items()}
+        }
+
+
+def write_rollup_records(records, base_path, month_folder, level):
+    """Acrescenta agregados de um nível a 'rollups/{apelido}_{nivel}.jsonl' no diretório mensal."""
+    rollup_path = os.path.join(base_path, month_folder, ROLLUP_DIR_NAME)
+    try:
+        os.makedirs(rollup_path, exist_ok=True)
+        records_by_identifier = {}
+        for record in records:
+            records_by_identifier.setdefault(record.get('machine_alias') or record.get('hostname'), []).append(record)
+        for file_identifier, identifier_records in records_by_identifier.items():
+            append_jsonl_records(os.path.join(rollup_path, f"{file_identifier}_{level}.jsonl"), identifier_records)
+        return True
+    except OSError as e:
+        logging.error(f"Erro ao gravar agregados '{level}' em '{rollup_path}': {e}")
+        return False
+
+def apply_raw_retention(base_path, file_identifier, retention_months, today=None):
+    """
+    Remove os arquivos brutos desta máquina ('{apelido}.jsonl', '.idx', '.cols') de meses com mais de
+    `retention_months` meses. Os agregados em 'rollups/' são mantidos. `retention_months` 0 desativa.
+    """
+    if not retention_months:
+        return
+    today = today or datetime.date.today()
+    month_index = today.year * 12 + today.month - 1 - retention_months
+    cutoff = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+    try:
+        month_folders = [name for name in os.listdir(base_path) if len(name) == 7 and name[4] == "-" and name < cutoff]
+    except OSError as e:
+        logging.error(f"Erro ao listar '{base_path}' para a retenção de dados brutos: {e}")
+        return
+    for month_folder in month_folders:
+        compressed_suffixes = [".jsonl" + extension + index for extension in COMPRESSION_FORMATS.values() for index in ("", ".idx")]
+        for suffix in (".jsonl", ".jsonl.idx", ".cols", *compressed_suffixes):
+            raw_path = os.path.join(base_path, month_folder, f"{file_identifier}{suffix}")
+            if os.path.exists(raw_path):
+                try:
+                    os.remove(raw_path)
+                    logging.info(f"Arquivo bruto '{raw_path}' removido pela retenção de {retention_months} meses.")
+                except OSError as e:
+                    logging.error(f"Erro ao remover arquivo bruto '{raw_path}': {e}")
+
+
+# --- Compactação dos meses fechados ---
+# Depois que um mês fecha (e passa COMPACTION_GRACE_HOURS, para o spool das máquinas esvaziar), cada arquivo de
+# dados do diretório mensal é regravado como '{nome}.jsonl.gz' (ou '.xz') em quadros independentes de
+# COMPRESSION_CHUNK_RECORDS registros. O índice '{nome}.jsonl.gz.idx' tem o mesmo formato do índice temporal,
+# com o offset do quadro onde começa cada bucket: uma consulta descompacta só os quadros do período.
+def _frame_records(records, compression):
+    payload = b''.join(serialize_jsonl_record(r) for r in records)
+    if compression == "lzma":
+        return lzma.compress(payload, format=lzma.FORMAT_XZ)
+    return gzip.compress(payload, mtime=0)
+
+def iter_json_array(file_full_path, chunk_size=1024 * 1024):
+    """Gera os elementos de um array JSON legado sem carregar o arquivo inteiro. Um final truncado é ignorado com aviso."""
+    decoder = json.JSONDecoder()
+    with open(file_full_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if buffer.startswith('['):
+            buffer = buffer[1:]
+        position = 0
+        while True:
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','):
+                position += 1
+            if position == len(buffer):
+                buffer, position = f.read(chunk_size), 0
+                if not buffer:
+                    return
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    logging.warning(f"Final de '{file_full_path}' ignorado (array JSON incompleto).")
+                    return
+                buffer, position = buffer[position:] + more, 0
+                continue
+            yield element
+
+def compact_data_file(file_full_path, compression=None, chunk_records=None):
+    """
+    Compacta um arquivo de dados ('.jsonl' ou array legado '.json') em '{nome}.jsonl' + extensão do formato.
+    Se o compactado já existir (registros que chegaram depois da compactação), os novos quadros são acrescentados.
+    O original é renomeado para '.compactando' antes da leitura e só é removido depois que o compactado e o
+    índice foram substituídos; uma interrupção no meio é retomada na próxima passada. O tamanho do compactado
+    antes do acréscimo fica em '.compactando.base': a retomada reaproveita só esse trecho, então um acréscimo
+    já feito antes da interrupção não é repetido.
+    Retorna (bytes_originais, bytes_compactados_acrescentados).
+    """
+    compression = compression or COMPRESSION_FORMAT
+    chunk_records = chunk_records or COMPRESSION_CHUNK_RECORDS
+    base_path, extension = os.path.splitext(file_full_path)
+    target_path = base_path + ".jsonl" + COMPRESSION_FORMATS[compression]
+    index_path = target_path + ".idx"
+    staging_path = file_full_path + ".compactando"
+    base_size_path = staging_path + ".base"
+
+    if not os.path.exists(staging_path):
+        if not os.path.exists(file_full_path):
+            return 0, 0
+        # O tamanho base é gravado antes do rename: enquanto existir '.compactando', ele também existe.
+        tmp_base_size_path = base_size_path + ".tmp"
+        with open(tmp_base_size_path, 'w', encoding='utf-8') as f:
+            f.write(str(os.path.getsize(target_path) if os.path.exists(target_path) else 0))
+        os.replace(tmp_base_size_path, base_size_path)
+        try:
+            os.replace(file_full_path, staging_path)
+        except OSError as e:
+            os.remove(base_size_path)
+            logging.warning(f"Arquivo '{file_full_path}' em uso. Compactação adiada: {e}")
+            return 0, 0
+    original_size = os.path.getsize(staging_path)
+    records = iter_json_array(staging_path) if extension == ".json" else read_jsonl_records(staging_path)
+
+    target_size = os.path.getsize(target_path) if os.path.exists(target_path) else 0
+    try:
+        with open(base_size_path, 'r', encoding='utf-8') as f:
+            base_size = min(int(f.read().strip()), target_size)
+    except (OSError, ValueError):
+        base_size = target_size
+    entries = [entry for entry in load_time_index(index_path) if entry[1] < base_size] if base_size else []
+    last_bucket = entries[-1][0] if entries else -1
+    tmp_path = target_path + ".tmp"
+    with open(tmp_path, 'wb') as out:
+        if base_size:
+            with open(target_path, 'rb') as existing:
+                remaining = base_size
+                while remaining:
+                    block = existing.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        break
+                    out.write(block)
+                    remaining -= len(block)
+        previous_size = out.tell()
+        chunk = []
+        for record in itertools.chain(records, [None]):
+            if record is not None:
+                chunk.append(record)
+                if len(chunk) < chunk_records:
+                    continue
+            if not chunk:
+                break
+            frame_offset = out.tell()
+            for chunk_record in chunk:
+                try:
+                    bucket = _time_bucket(record_epoch(chunk_record))
+                except (KeyError, ValueError):
+                    continue
+                if bucket > last_bucket:
+                    entries.append((bucket, frame_offset))
+                    last_bucket = bucket
+            out.write(_frame_records(chunk, compression))
+            chunk = []
+        added_size = out.tell() - previous_size
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, target_path)
+
+    tmp_index_path = index_path + ".tmp"
+    with open(tmp_index_path, 'w', encoding='utf-8') as f:
+        f.write(''.join(f"{bucket} {offset}\n" for bucket, offset in entries))
+    os.replace(tmp_index_path, index_path)
+
+    os.remove(staging_path)
+    if os.path.exists(base_size_path):
+        os.remove(base_size_path)
+    if extension == ".jsonl" and os.path.exists(file_full_path + ".idx"):
+        os.remove(file_full_path + ".idx")
+    return original_size, added_size
+
+def _compactable_files(directory):
+    """Arquivos de dados ainda não compactados (inclusive os interrompidos no meio de uma compactação)."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    files = set()
+    for name in names:
+        if name.endswith(".compactando"):
+            name = name[:-len(".compactando")]
+        if name == MERGE_STATE_FILE_NAME or not name.endswith((".jsonl", ".json")):
+            continue
+        files.add(os.path.join(directory, name))
+    return sorted(files)
+
+def compact_month(monthly_path, compression=None):
+    """Compacta os arquivos de dados do diretório mensal e de 'rollups/', 'inventario/' e 'metricas/'. Retorna (bytes_originais, bytes_compactados)."""
+    total_original = total_compressed = 0
+    for directory in (monthly_path, *(os.path.join(monthly_path, name) for name in (ROLLUP_DIR_NAME, INVENTORY_DIR_NAME, METRICS_DIR_NAME))):
+        for file_full_path in _compactable_files(directory):
+            try:
+                original_size, compressed_size = compact_data_file(file_full_path, compression)
+            except Exception as e:
+                logging.error(f"Erro ao compactar '{file_full_path}': {e}")
+                continue
+            total_original += original_size
+            total_compressed += compressed_size
+    if total_original:
+        logging.info(f"Diretório '{monthly_path}' compactado: {total_original} -> {total_compressed} bytes ({total_original / max(total_compressed, 1):.1f}x).")
+    return total_original, total_compressed
+
+def compact_closed_months(base_path, compression=None, grace_hours=None, now=None):
+    """Compacta os diretórios mensais fechados há mais de `grace_hours` horas."""
+    compression = compression or COMPRESSION_FORMAT
+    grace_hours = COMPACTION_GRACE_HOURS if grace_hours is None else grace_hours
+    now = now or datetime.datetime.now()
+    try:
+        month_folders = sorted(name for name in os.listdir(base_path) if len(name) == 7 and name[4] == "-")
+    except OSError as e:
+        logging.error(f"Erro ao listar '{base_path}' para a compactação: {e}")
+        return
+    for month_folder in month_folders:
+        try:
+            first_day = datetime.datetime.strptime(month_folder, "%Y-%m")
+        except ValueError:
+            continue
+        next_month = (first_day + datetime.timedelta(days=32)).replace(day=1)
+        if now >= next_month + datetime.timedelta(hours=grace_hours):
+            compact_month(os.path.join(base_path, month_folder), compression)
+
+
+# --- Modo merger: consolidação incremental do arquivo geral mensal ---
+def list_host_shards(monthly_path):
+    """
+    Lista os arquivos .jsonl de cada máquina no diretório mensal.
+    Ignora o arquivo geral e arquivos auxiliares (iniciados por '_').
+    """
+    general_name = f"{GENERAL_FILE_BASENAME}.jsonl"
+    shards = []
+    try:
+        entries = os.listdir(monthly_path)
+    except OSError as e:
+        logging.error(f"Erro ao listar o diretório mensal '{monthly_path}': {e}")
+        return shards
+    for name in sorted(entries):
+        if not name.endswith(".jsonl") or name == general_name or name.startswith("_"):
+            continue
+        full_path = os.path.join(monthly_path, name)
+        if os.path.isfile(full_path):
+            shards.append(full_path)
+    return shards
+
+def _load_merge_state(state_path):
+    if not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Estado do merger '{state_path}' ilegível ({e}). Consolidação será refeita do início.")
+        return {}
+
+def _save_merge_state(state_path, state):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, state_path)
+
+def _read_complete_lines(file_full_path, offset, max_bytes=MERGE_MAX_BYTES_PER_PASS):
+    """
+    Lê até `max_bytes` novos a partir de `offset` e retorna (bytes_de_linhas_completas, novo_offset).
+    Uma linha ainda sendo escrita (sem '\\n' final) fica para a próxima passada.
+    """
+    with open(file_full_path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read(max_bytes)
+    last_newline = chunk.rfind(b'\n')
+    if last_newline < 0:
+        return b'', offset
+    return chunk[:last_newline + 1], offset + last_newline + 1
+
+def merge_monthly_shards(monthly_path):
+    """
+    Acrescenta ao arquivo geral mensal apenas as linhas novas de cada máquina desde a última passada.
+    Os offsets já consolidados ficam em MERGE_STATE_FILE_NAME. Um arquivo de máquina menor que o
+    offset salvo (truncado ou recriado) é consolidado novamente do início.
+    As linhas são gravadas em lotes de até MERGE_MAX_BYTES_PER_PASS, com o estado salvo após cada lote:
+    a memória usada não cresce com o número de máquinas.
+    Deve existir apenas um merger por SHARED_NETWORK_PATH. Retorna o número de bytes consolidados.
+    """
+    state_path = os.path.join(monthly_path, MERGE_STATE_FILE_NAME)
+    general_full_path = os.path.join(monthly_path, f"{GENERAL_FILE_BASENAME}.jsonl")
+    state = _load_merge_state(state_path)
+
+    pending = []
+    pending_bytes = 0
+    merged_bytes = 0
+    new_state = dict(state)
+
+    def _write_pending():
+        payload = b''.join(pending)
+        _ensure_trailing_newline(general_full_path)
+        with open(general_full_path, 'ab') as f:
+            f.write(payload)
+        # O estado é salvo depois da escrita: uma falha entre as duas etapas pode duplicar linhas, nunca perdê-las.
+        _save_merge_state(state_path, new_state)
+        pending.clear()
+        return len(payload)
+
+    for shard_path in list_host_shards(monthly_path):
+        shard_name = os.path.basename(shard_path)
+        offset = state.get(shard_name, 0)
+        try:
+            if os.path.getsize(shard_path) < offset:
+                logging.warning(f"Arquivo '{shard_path}' menor que o offset consolidado ({offset}). Reiniciando a partir do início.")
+                offset = 0
+            lines, new_offset = _read_complete_lines(shard_path, offset)
+        except OSError as e:
+            logging.error(f"Erro ao ler '{shard_path}' durante a consolidação: {e}")
+            continue
+        if lines:
+            if pending_bytes + len(lines) > MERGE_MAX_BYTES_PER_PASS and pending:
+                merged_bytes += _write_pending()
+                pending_bytes = 0
+            pending.append(lines)
+            pending_bytes += len(lines)
+        new_state[shard_name] = new_offset
+
+    if pending:
+        merged_bytes += _write_pending()
+    if merged_bytes:
+        logging.info(f"{merged_bytes} bytes consolidados em '{general_full_path}'.")
+    return merged_bytes
+
+def _previous_month_folder(current_date):
+    first_day = current_date.replace(day=1)
+    return (first_day - datetime.timedelta(days=1)).strftime("%Y-%m")
+
+def run_merger(base_path, interval_seconds, run_once=False):
+    """
+    Executa o merger em laço. A cada passada consolida o mês atual e o anterior (para fechar a virada do mês).
+    Com COMPRESSION_FORMAT, compacta também os meses fechados, no máximo a cada COMPACTION_CHECK_INTERVAL_SECONDS.
+    """
+    logging.info(f"Iniciando merger do arquivo geral em: {os.path.abspath(base_path)}")
+    last_compaction = None
+    while True:
+        current_date = datetime.datetime.now()
+        for month_folder in (_previous_month_folder(current_date), current_date.strftime("%Y-%m")):
+            monthly_path = os.path.join(base_path, month_folder)
+            if os.path.isdir(monthly_path):
+                try:
+                    merge_monthly_shards(monthly_path)
+                except Exception as e:
+                    logging.error(f"Erro ao consolidar o diretório mensal '{monthly_path}': {e}")
+        if COMPRESSION_FORMAT and (last_compaction is None or time.monotonic() - last_compaction >= COMPACTION_CHECK_INTERVAL_SECONDS):
+            compact_closed_months(base_path)
+            last_compaction = time.monotonic()
+        if run_once:
+            return
+        time.sleep(interval_seconds)
+
+
+
+# --- Modo consumidor: leitura incremental para painéis da frota ---
+# Acompanha os arquivos de cada máquina do mês atual (e do anterior, para fechar a virada do mês) a partir dos
+# offsets salvos em um checkpoint local, e mantém a amostra mais recente de cada machine_alias. O custo de cada
+# passada depende só do que foi gravado desde a anterior, não do tamanho acumulado do mês.
+class TailConsumer:
+    """
+    Consumidor incremental dos arquivos '.jsonl' das máquinas.
+    `poll()` processa as linhas novas; `latest` é a tabela {machine_alias: amostra completa mais recente};
+    `save()` grava o snapshot dessa tabela e, em seguida, o checkpoint dos offsets.
+    """
+
+    def __init__(self, base_path, checkpoint_path, snapshot_path):
+        self.base_path = base_path
+        self.checkpoint_path = checkpoint_path
+        self.snapshot_path = snapshot_path
+        self.offsets = _load_merge_state(checkpoint_path)
+        self.latest = {}
+        if os.path.exists(snapshot_path):
+            try:
+                with open(snapshot_path, 'r', encoding='utf-8') as f:
+                    self.latest = json.load(f).get("maquinas", {})
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                logging.warning(f"Snapshot '{snapshot_path}' ilegível ({e}). Estado reconstruído a partir das próximas amostras.")
+
+    def _update_latest(self, sample):
+        alias = sample.get('machine_alias') or sample.get('hostname')
+        current = self.latest.get(alias)
+        try:
+            if current is not None and record_epoch(current) > record_epoch(sample):
+                return
+        except (KeyError, ValueError):
+            return
+        self.latest[alias] = sample
+
+    def _poll_month(self, month_folder):
+        monthly_path = os.path.join(self.base_path, month_folder)
+        month_offsets = self.offsets.setdefault(month_folder, {})
+        shards = list_host_shards(monthly_path) if os.path.isdir(monthly_path) else []
+        present = {os.path.basename(shard_path) for shard_path in shards}
+        for shard_name in [name for name in month_offsets if name not in present]:
+            del month_offsets[shard_name]
+
+        new_records = []
+        for shard_path in shards:
+            shard_name = os.path.basename(shard_path)
+            offset = month_offsets.get(shard_name, 0)
+            try:
+                if os.path.getsize(shard_path) < offset:
+                    logging.warning(f"Arquivo '{shard_path}' menor que o offset lido ({offset}). Relendo a partir do início.")
+                    offset = 0
+                lines, new_offset = _read_complete_lines(shard_path, offset)
+            except OSError as e:
+                logging.error(f"Erro ao ler '{shard_path}' no consumidor: {e}")
+                continue
+            month_offsets[shard_name] = new_offset
+            for raw_line in lines.splitlines():
+                if not raw_line.strip():
+                    continue
+                try:
+                    new_records.append(json.loads(raw_line))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logging.warning(f"Linha corrompida ignorada em '{shard_path}'.")
+
+        if not new_records:
+            return 0
+        inventories = load_inventories(monthly_path)
+        # A última amostra conhecida de cada máquina serve de base para os registros delta que chegaram agora.
+        seeds = [
+            self.latest[alias] for alias in {r.get('machine_alias') or r.get('hostname') for r in new_records if r.get('_delta')}
+            if alias in self.latest
+        ]
+        for sample in decode_samples(seeds + new_records, inventories):
+            self._update_latest(sample)
+        return len(new_records)
+
+    def poll(self, now=None):
+        """Processa os registros novos do mês anterior e do atual. Retorna quantos registros foram lidos."""
+        now = now or datetime.datetime.now()
+        months = (_previous_month_folder(now), now.strftime("%Y-%m"))
+        for month_folder in [name for name in self.offsets if name not in months]:
+            del self.offsets[month_folder]
+        return sum(self._poll_month(month_folder) for month_folder in months)
+
+    def save(self):
+        """Grava o snapshot e depois o checkpoint: após uma falha, registros podem ser relidos, nunca pulados."""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"gerado_em": datetime.datetime.now().strftime(TIMESTAMP_FORMAT), "maquinas": self.latest}, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+        _save_merge_state(self.checkpoint_path, self.offsets)
+
+def run_consumer(base_path, checkpoint_path, snapshot_path, interval_seconds, snapshot_interval_seconds=CONSUMER_SNAPSHOT_INTERVAL_SECONDS, run_once=False):
+    """Executa o consumidor em laço, gravando o snapshot a cada `snapshot_interval_seconds`."""
+    logging.info(f"Iniciando consumidor incremental em: {os.path.abspath(base_path)}. Snapshot: {snapshot_path}")
+    consumer = TailConsumer(base_path, checkpoint_path, snapshot_path)
+    last_save = time.monotonic()
+    while True:
+        try:
+            consumer.poll()
+        except Exception as e:
+            logging.error(f"Erro na leitura incremental de '{base_path}': {e}")
+        if run_once or time.monotonic() - last_save >= snapshot_interval_seconds:
+            try:
+                consumer.save()
+            except OSError as e:
+                logging.error(f"Erro ao gravar o snapshot '{snapshot_path}': {e}")
+            last_save = time.monotonic()
+        if run_once:
+            return consumer
+        time.sleep(interval_seconds)
+
+
+# --- Spool local com envio em lotes ---
+class LocalSpool:
+    """
+    Fila local (outbox) de amostras em segmentos .jsonl no diretório do agente.
+    A coleta só escreve no disco local; o envio ao SHARED_NETWORK_PATH é feito em lotes por `flush`.
+    O spool é limitado por tamanho total e idade: os segmentos mais antigos são descartados primeiro.
+    """
+
+    def __init__(self, spool_dir, max_bytes, max_age_seconds, segment_max_bytes=SPOOL_SEGMENT_MAX_BYTES):
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        self._active_path = None
+        self._active_size = 0
+        self._in_flight = set()
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def _segments(self):
+        return sorted(
+            os.path.join(self.spool_dir, name)
+            for name in os.listdir(self.spool_dir)
+            if name.startswith("segmento_") and name.endswith(".jsonl")
+        )
+
+    def _new_segment_path(self):
+        return os.path.join(self.spool_dir, f"segmento_{time.time_ns():020d}.jsonl")
+
+    def enqueue(self, data, month_folder=None, rollup_level=None):
+        """
+        Grava a amostra (ou um agregado de nível `rollup_level`) no segmento ativo.
+        O mês de destino, se não informado, é o do horário da própria amostra.
+        Custo: um append local, independente da rede.
+        """
+        if month_folder is None:
+            try:
+                month_folder = datetime.datetime.fromtimestamp(record_epoch(data)).strftime("%Y-%m")
+            except (KeyError, ValueError):
+                month_folder = datetime.datetime.now().strftime("%Y-%m")
+        envelope = {"mes": month_folder, "dados": data}
+        if rollup_level is not None:
+            envelope["rollup"] = rollup_level
+        with self._lock:
+            if self._active_path is None or self._active_size >= self.segment_max_bytes:
+                self._active_path = self._new_segment_path()
+                self._active_size = 0
+            self._active_size += append_jsonl_records(self._active_path, [envelope], metrics_stage="spool")
+            self._enforce_limits()
+
+    def _rotate(self):
+        """Fecha o segmento ativo e retorna todos os segmentos prontos para envio (mais antigos primeiro)."""
+        with self._lock:
+            self._active_path = None
+            self._active_size = 0
+            segments = self._segments()
+            self._in_flight.update(segments)
+            return segments
+
+    def _enforce_limits(self):
+        """Descarta segmentos além da idade ou do tamanho máximo, começando pelos mais antigos. Chamado com `_lock`."""
+        now = time.time()
+        sizes = []
+        for segment in self._segments():
+            try:
+                stat = os.stat(segment)
+            except OSError:
+                continue
+            sizes.append((segment, stat.st_size, stat.st_mtime))
+        total = sum(size for _, size, _ in sizes)
+
+        for segment, size, mtime in sizes:
+            if segment in self._in_flight or segment == self._active_path:
+                continue
+            expired = now - mtime > self.max_age_seconds
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                os.remove(segment)
+                total -= size
+                logging.warning(f"Segmento do spool '{segment}' ({size} bytes) descartado por {'idade' if expired else 'limite de tamanho'}.")
+            except OSError as e:
+                logging.error(f"Erro ao descartar segmento do spool '{segment}': {e}")
+
+    @staticmethod
+    def _destinations(envelope):
+        """
+        Destinos de um envelope: (mês, nível_do_agregado, arquivo). Sem SHARDED_STORAGE, uma amostra vai ao
+        arquivo da máquina e ao arquivo geral como destinos separados, para que uma falha só no geral não
+        reenvie a amostra ao arquivo da máquina.
+        """
+        month_folder, rollup_level = envelope.get("mes"), envelope.get("rollup")
+        if rollup_level is not None:
+            return [(month_folder, rollup_level, None)]
+        if envelope.get("arquivo"):
+            return [(month_folder, None, envelope["arquivo"])]
+        if SHARDED_STORAGE:
+            return [(month_folder, None, None)]
+        return [(month_folder, None, "maquina"), (month_folder, None, "geral")]
+
+    def _keep_unsent(self, segment, envelopes_by_destination, sent_destinations):
+        """Regrava o segmento só com os envelopes dos destinos ainda não enviados, para não reenviar os demais."""
+        remaining = [
+            {**envelope, "arquivo": destination[2]} if destination[2] else envelope
+            for destination, envelopes in envelopes_by_destination.items() if destination not in sent_destinations
+            for envelope in envelopes
+        ]
+        tmp_path = segment + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(serialize_jsonl_record(envelope) for envelope in remaining))
+        os.replace(tmp_path, segment)
+
+    def flush(self, base_path):
+        """
+        Envia os segmentos pendentes, do mais antigo ao mais recente, agrupando as amostras por mês
+        para uma única escrita por arquivo de destino. Para no primeiro segmento que falhar, preservando a ordem;
+        os destinos daquele segmento já enviados são retirados dele antes da nova tentativa.
+        Retorna o número de amostras enviadas.
+        """
+        sent = 0
+        segments = self._rotate()
+        try:
+            for segment in segments:
+                envelopes_by_destination = {}
+                for envelope in read_jsonl_records(segment):
+                    for destination in self._destinations(envelope):
+                        envelopes_by_destination.setdefault(destination, []).append(envelope)
+
+                sent_destinations = set()
+                try:
+                    for destination, envelopes in envelopes_by_destination.items():
+                        month_folder, rollup_level, target = destination
+                        records = [envelope.get("dados") for envelope in envelopes]
+                        if rollup_level is not None:
+                            written = write_rollup_records(records, base_path, month_folder, rollup_level)
+                        else:
+                            written = write_records_to_files(
+                                records, base_path, month_folder=month_folder, max_retries=1,
+                                targets=(target,) if target else None
+                            )
+                        if not written:
+                            logging.warning(f"Envio do spool interrompido em '{segment}'. Nova tentativa no próximo ciclo.")
+                            return sent
+                        sent_destinations.add(destination)
+                        if target != "geral":
+                            sent += len(records)
+                finally:
+                    if sent_destinations and len(sent_destinations) < len(envelopes_by_destination):
+                        self._keep_unsent(segment, envelopes_by_destination, sent_destinations)
+
+                os.remove(segment)
+        except OSError as e:
+            logging.error(f"Erro ao enviar spool local para '{base_path}': {e}")
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(segments)
+        if sent:
+            logging.info(f"{sent} amostras do spool enviadas para '{base_path}'.")
+        return sent
+
+
+def start_spool_flusher(spool, base_path, interval_seconds):
+    """Inicia a thread de envio periódico do spool."""
+    def _flush_loop():
+        while True:
+            try:
+                with profiled(), stage_metrics.timed("spool.envio"):
+                    spool.flush(base_path)
+            except Exception as e:
+                logging.error(f"Erro inesperado no envio do spool: {e}")
+            time.sleep(interval_seconds)
+
+    flusher = threading.Thread(target=_flush_loop, name="spool-flusher", daemon=True)
+    flusher.start()
+    return flusher
+
+
+# --- Agendador da coleta ---
+def run_collection_loop(interval_seconds, on_tick):
+    """
+    Chama `on_tick(horario_agendado)` em prazos fixos no relógio monotônico, sem deriva.
+    Os prazos são alinhados a múltiplos de `interval_seconds` no relógio de parede, para que
+    os horários de coleta coincidam entre as máquinas. Se um ciclo atrasar além do próximo prazo,
+    os prazos perdidos são pulados em vez de acumulados.
+    """
+    wall_anchor = time.time()
+    mono_anchor = time.monotonic()
+    first_wall_deadline = (int(wall_anchor // interval_seconds) + 1) * interval_seconds
+    next_deadline = mono_anchor + (first_wall_deadline - wall_anchor)
+
+    while True:
+        delay = next_deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        scheduled_time = datetime.datetime.fromtimestamp(wall_anchor + (next_deadline - mono_anchor))
+        on_tick(scheduled_time)
+
+        next_deadline += interval_seconds
+        now = time.monotonic()
+        if now > next_deadline:
+            skipped = int((now - next_deadline) // interval_seconds) + 1
+            logging.warning(f"Ciclo de coleta atrasado. {skipped} prazo(s) pulado(s).")
+            next_deadline += skipped * interval_seconds
+
+
+# --- Simulador de frota e benchmarks (--benchmark) ---
+# Mede o caminho de gravação com N agentes simulados (threads ou processos) escrevendo em um diretório local,
+# e o caminho de coleta com backends falsos de psutil e WMI, para comparar mudanças em uma máquina Linux comum.
+
+def synthetic_hardware_data(machine_alias, moment, rng):
+    """Amostra sintética com o mesmo formato de `get_hardware_data` (incluindo os campos do Open Hardware Monitor)."""
+    cores = {f"cpu_core_{i}": round(rng.uniform(35, 85), 2) for i in range(1, 9)}
+    return {
+        "hostname": f"HOST-{machine_alias}",
+        "machine_alias": machine_alias,
+        "timestamp_coleta": moment.strftime(TIMESTAMP_FORMAT),
+        "timestamp_epoch": int(moment.timestamp()),
+        "monitoramento": {
+            "cpu": {
+                "percentual_uso": round(rng.uniform(0, 100), 1), "nucleos_fisicos": 8, "nucleos_logicos": 16,
+                "nome": "Intel Core i7-10700", "temperatura_package_celsius": max(cores.values()),
+                "temperaturas_cores_celsius": cores, "uso_total_percent": round(rng.uniform(0, 100), 2),
+                "energia_watts": {"cpu_package": round(rng.uniform(10, 65), 2), "cpu_cores": round(rng.uniform(5, 50), 2)},
+                "clocks_mhz": {f"cpu_core_{i}": round(rng.uniform(800, 4800), 2) for i in range(1, 9)}
+            },
+            "memoria_ram": {"total_gb": 31.87, "usado_gb": round(rng.uniform(4, 30), 2), "percentual_uso": round(rng.uniform(10, 95), 1)},
+            "disco_principal": {
+                "total_gb": 476.31, "usado_gb": 210.5, "livre_gb": 265.81, "percentual_uso": 44.2,
+                "nome": "Samsung SSD 970 EVO", "temperatura_celsius": round(rng.uniform(30, 50), 2)
+            },
+            "discos_adicionais": [
+                {"nome": "WDC WD10EZEX", "tipo": "HDD", "temperatura_celsius": round(rng.uniform(28, 45), 2), "uso_espaco_percent": 61.3, "vida_util_restante_percent": 97.0}
+            ],
+            "gpu": {
+                "nome": "NVIDIA GeForce GTX 1660", "tipo": "GpuNvidia", "temperatura_core_celsius": round(rng.uniform(30, 80), 2),
+                "uso_percentual": round(rng.uniform(0, 100), 2),
+                "memoria_gpu": {"usada_mb": round(rng.uniform(200, 6000), 2), "livre_mb": 1000.0, "total_mb": 6144.0},
+                "clocks_mhz": {"gpu_core": round(rng.uniform(300, 1900), 2), "gpu_memory": 4001.0}
+            },
+            "rede": {"bytes_enviados_mb": round(rng.uniform(0, 10**5), 2), "bytes_recebidos_mb": round(rng.uniform(0, 10**6), 2), "velocidade_atual_mbps": round(rng.uniform(0, 100), 2)},
+            "placa_mae": {"nome": "ASUS PRIME B460M", "temperaturas_celsius": {"temperature_1": round(rng.uniform(25, 45), 2)}},
+            "uptime_horas": round(rng.uniform(0, 500), 2),
+            "disco_io": {"leitura_mb_s": round(rng.uniform(0, 200), 2), "escrita_mb_s": round(rng.uniform(0, 200), 2)}
+        }
+    }
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def prefill_month(base_path, machine_alias, fill_days, config, chunk=2000):
+    """Simula um mês já com `fill_days` dias de amostras da máquina (no intervalo de coleta configurado), antes da medição."""
+    _apply_configuration(config)
+    interval_seconds = COLLECTION_INTERVAL_SECONDS
+    rng = random.Random(machine_alias)
+    now = datetime.datetime.now()
+    total = int(fill_days * 86400 / interval_seconds)
+    start = now - datetime.timedelta(seconds=total * interval_seconds)
+    month_folder = now.strftime("%Y-%m")
+    for offset in range(0, total, chunk):
+        records = [
+            synthetic_hardware_data(machine_alias, start + datetime.timedelta(seconds=interval_seconds * i), rng)
+            for i in range(offset, min(offset + chunk, total))
+        ]
+        write_records_to_files(records, base_path, month_folder=month_folder, max_retries=1)
+
+def simulate_agent(machine_alias, base_path, duration_seconds, interval_seconds, config):
+    """Um agente simulado: grava amostras sintéticas em prazos fixos por `duration_seconds` e devolve suas medições."""
+    _apply_configuration(config)
+    rng = random.Random(machine_alias)
+    latencies = []
+    dropped = 0
+    started = time.monotonic()
+    # Início espalhado dentro do intervalo, como uma frota real que não liga toda ao mesmo tempo.
+    next_deadline = started + rng.uniform(0, interval_seconds)
+    end = started + duration_seconds
+    while next_deadline < end:
+        delay = next_deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        data = synthetic_hardware_data(machine_alias, datetime.datetime.now(), rng)
+        write_started = time.perf_counter()
+        if not write_data_to_files(data, base_path):
+            dropped += 1
+        latencies.append(time.perf_counter() - write_started)
+        next_deadline += interval_seconds
+    return {"latencias": latencies, "descartadas": dropped, "locks": get_lock_wait_stats()}
+
+def run_write_benchmark(base_path, agents, duration_seconds, interval_seconds, fill_days=0, use_processes=False, config=None):
+    """
+    Executa `agents` agentes simulados gravando em `base_path` e retorna um relatório com vazão,
+    percentis de latência por gravação, espera por bloqueios, amostras descartadas e bytes gravados.
+    """
+    config = dict(config or {})
+    config.setdefault("SHARED_NETWORK_PATH", base_path)
+    aliases = [f"SIM{i:04d}" for i in range(agents)]
+    executor_class = concurrent.futures.ProcessPoolExecutor if use_processes else concurrent.futures.ThreadPoolExecutor
+
+    with executor_class(max_workers=agents) as executor:
+        if fill_days:
+            list(executor.map(prefill_month, [base_path] * agents, aliases, [fill_days] * agents, [config] * agents))
+        bytes_before = _directory_size(base_path)
+        started = time.monotonic()
+        results = list(executor.map(simulate_agent, aliases, [base_path] * agents, [duration_seconds] * agents, [interval_seconds] * agents, [config] * agents))
+        elapsed = time.monotonic() - started
+
+    latencies = sorted(latency for result in results for latency in result["latencias"])
+    # Em modo threads todos os agentes compartilham as estatísticas de bloqueio do processo.
+    lock_results = [result["locks"] for result in results] if use_processes else [results[0]["locks"]] if results else []
+    lock_wait_total = sum(stats.get("espera_total_s", 0.0) for stats in lock_results)
+    lock_wait_max = max((stats.get("espera_max_s", 0.0) for stats in lock_results), default=0.0)
+    dropped = sum(result["descartadas"] for result in results)
+    return {
+        "agentes": agents,
+        "modo": "processos" if use_processes else "threads",
+        "formato": config.get("STORAGE_FORMAT", DEFAULT_CONFIG["STORAGE_FORMAT"]),
+        "particionado": config.get("SHARDED_STORAGE", DEFAULT_CONFIG["SHARDED_STORAGE"]),
+        "preenchimento_dias": fill_days,
+        "duracao_s": round(elapsed, 2),
+        "gravacoes": len(latencies),
+        "vazao_gravacoes_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latencia_ms": {
+            "p50": round(_percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            "p95": round(_percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+            "p99": round(_percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "max": round(latencies[-1] * 1000, 3) if latencies else None
+        },
+        "espera_lock_total_s": round(lock_wait_total, 3),
+        "espera_lock_max_s": round(lock_wait_max, 3),
+        "contencoes_lock": sum(stats.get("contencoes", 0) for stats in lock_results),
+        "timeouts_lock": sum(stats.get("timeouts", 0) for stats in lock_results),
+        "descartadas": dropped,
+        "bytes_gravados": _directory_size(base_path) - bytes_before
+    }
+
+
+class FakePsutil:
+    """Backend psutil em memória para medir a coleta sem depender do SO."""
+
+    def __init__(self, seed=0):
+        self._rng = random.Random(seed)
+        self._net = 0
+        self._disk = 0
+
+    def cpu_percent(self, interval=None):
+        return round(self._rng.uniform(0, 100), 1)
+
+    def virtual_memory(self):
+        return types.SimpleNamespace(total=32 * 1024**3, used=int(self._rng.uniform(4, 30) * 1024**3), percent=round(self._rng.uniform(10, 95), 1))
+
+    def disk_usage(self, path):
+        return types.SimpleNamespace(total=500 * 1024**3, used=210 * 1024**3, free=290 * 1024**3, percent=42.0)
+
+    def net_io_counters(self):
+        self._net += self._rng.randint(0, 10**7)
+        return types.SimpleNamespace(bytes_sent=self._net, bytes_recv=self._net * 3)
+
+    def disk_io_counters(self):
+        self._disk += self._rng.randint(0, 10**8)
+        return types.SimpleNamespace(read_bytes=self._disk, write_bytes=self._disk // 2)
+
+    def cpu_count(self, logical=True):
+        return 16 if logical else 8
+
+    def boot_time(self):
+        return time.time() - 86400
+
+
+def fake_ohm_inventory(hardware_count=6, sensors_per_hardware=25, seed=0):
+    """Inventário e leituras sintéticos do Open Hardware Monitor (CPU, GPU, placa-mãe e discos)."""
+    rng = random.Random(seed)
+    base_hardware = [("/intelcpu/0", "Intel Core i7-10700", "CPU"), ("/nvidiagpu/0", "NVIDIA GeForce GTX 1660", "GpuNvidia"), ("/mainboard", "ASUS PRIME B460M", "Mainboard")]
+    hardware = [HardwareInfo(*entry) for entry in base_hardware[:hardware_count]]
+    for i in range(len(hardware), hardware_count):
+        hardware.append(HardwareInfo(f"/hdd/{i}", f"Disco SSD {i}", "HDD"))
+    sensor_types = ("Temperature", "Load", "Clock", "Power", "SmallData", "Data", "Level")
+    sensors = []
+    for hw in hardware:
+        for i in range(sensors_per_hardware):
+            sensor_type = sensor_types[i % len(sensor_types)]
+            sensors.append(SensorReading(hw.identifier, f"Sensor #{i}", sensor_type, rng.uniform(0, 100)))
+        sensors.append(SensorReading(hw.identifier, "CPU Package", "Temperature", rng.uniform(30, 90)))
+        sensors.append(SensorReading(hw.identifier, "GPU Core", "Load", rng.uniform(0, 100)))
+    return hardware, sensors
+
+def run_collection_benchmark(iterations=1000, hardware_count=6, sensors_per_hardware=25):
+    """Mede os coletores com backends falsos de psutil e WMI. Retorna p50/p95/máximo em milissegundos."""
+    global psutil
+    hardware, sensors = fake_ohm_inventory(hardware_count, sensors_per_hardware)
+    original_psutil, original_provider = psutil, _sensor_provider
+    psutil = FakePsutil()
+    set_sensor_provider(FakeSensorProvider(hardware, sensors))
+    collectors = [
+        ("psutil", _collect_psutil, None), ("psutil_disco", _collect_psutil_disk, None),
+        ("psutil_inventario", _collect_psutil_inventory, None), ("ohm", _collect_ohm_sensors, None)
+    ]
+    timings = {f"coleta.{name}": [] for name, _, _ in collectors}
+    timings.update({"parse_ohm_sensors": [], "get_hardware_data": []})
+    main_disk_path = 'C:\\' if platform.system() == "Windows" else '/'
+    try:
+        for _ in range(iterations):
+            for name, function, _ in collectors:
+                started = time.perf_counter()
+                function(main_disk_path)
+                timings[f"coleta.{name}"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            parse_ohm_sensors(hardware, sensors, main_disk_path)
+            timings["parse_ohm_sensors"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            fragments = _run_collectors(collectors, main_disk_path, COLLECTOR_TIMEOUT_SECONDS)
+            monitoramento_data = _new_monitoramento_data()
+            for _, fragment in fragments:
+                _merge_monitoramento(monitoramento_data, fragment)
+            timings["get_hardware_data"].append(time.perf_counter() - started)
+    finally:
+        psutil = original_psutil
+        set_sensor_provider(original_provider)
+
+    report = {"iteracoes": iterations, "hardware": hardware_count, "sensores": len(sensors)}
+    for stage, values in timings.items():
+        values.sort()
+        report[stage] = {
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 4),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 4),
+            "max_ms": round(values[-1] * 1000, 4)
+        }
+    return report
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Agente de monitoramento 10KK VIEW.")
+    parser.add_argument("--exportar", metavar="ARQUIVO_JSONL",
+                        help="Exporta um arquivo .jsonl para o formato legado (array JSON) e encerra.")
+    parser.add_argument("--saida", metavar="ARQUIVO_JSON",
+                        help="Caminho do arquivo gerado por --exportar (padrão: mesmo nome com extensão .json).")
+    parser.add_argument("--consultar", metavar="ARQUIVO_JSONL",
+                        help="Imprime (uma linha JSON por registro) as amostras do arquivo no período de --inicio a --fim e encerra.")
+    parser.add_argument("--inicio", metavar="\"DD/MM/AAAA HH:MM:SS\"", help="Início do período de --consultar.")
+    parser.add_argument("--fim", metavar="\"DD/MM/AAAA HH:MM:SS\"", help="Fim do período de --consultar.")
+    parser.add_argument("--benchmark", choices=("escrita", "coleta"),
+                        help="Executa um benchmark e imprime o relatório em JSON: 'escrita' simula uma frota gravando em um diretório local; 'coleta' mede os coletores com backends falsos.")
+    parser.add_argument("--agentes", type=int, default=50, help="Benchmark de escrita: quantidade de agentes simulados.")
+    parser.add_argument("--duracao", type=float, default=60, help="Benchmark de escrita: duração da medição em segundos.")
+    parser.add_argument("--intervalo", type=float, default=None, help="Benchmark de escrita: intervalo entre gravações de cada agente (padrão: COLLECTION_INTERVAL_SECONDS).")
+    parser.add_argument("--preenchimento-dias", type=float, default=0, help="Benchmark de escrita: dias de amostras já existentes no mês antes da medição.")
+    parser.add_argument("--processos", action="store_true", help="Benchmark de escrita: um processo por agente em vez de threads.")
+    parser.add_argument("--destino", metavar="DIRETORIO", help="Benchmark de escrita: diretório de destino (padrão: diretório temporário).")
+    parser.add_argument("--iteracoes", type=int, default=1000, help="Benchmark de coleta: quantidade de iterações.")
+    parser.add_argument("--compactar", action="store_true",
+                        help="Compacta os meses fechados de SHARED_NETWORK_PATH (ver COMPRESSION_FORMAT) e encerra.")
+    parser.add_argument("--merger", action="store_true",
+                        help="Executa o consolidador do arquivo geral mensal em vez da coleta.")
+    parser.add_argument("--consumidor", action="store_true",
+                        help="Acompanha incrementalmente os arquivos das máquinas e grava o estado mais recente de cada uma em um snapshot.")
+    parser.add_argument("--checkpoint", metavar="ARQUIVO",
+                        help=f"Com --consumidor, arquivo local dos offsets lidos (padrão: '{CONSUMER_CHECKPOINT_FILE_NAME}' ao lado do agente).")
+    parser.add_argument("--snapshot", metavar="ARQUIVO",
+                        help=f"Com --consumidor, arquivo do estado mais recente por máquina (padrão: '{CONSUMER_SNAPSHOT_FILE_NAME}' ao lado do agente).")
+    parser.add_argument("--uma-vez", action="store_true",
+                        help="Com --merger ou --consumidor, executa uma única passada e encerra.")
+    return parser.parse_args(argv)
+
+
+# --- Execução principal do script ---
+if __name__ == '__main__':
+    args = parse_arguments()
+    load_configuration() 
+
+    if args.exportar:
+        export_jsonl_to_json_array(args.exportar, args.saida)
+        sys.exit(0)
+
+    if args.consultar:
+        start_epoch = datetime.datetime.strptime(args.inicio, TIMESTAMP_FORMAT).timestamp() if args.inicio else None
+        end_epoch = datetime.datetime.strptime(args.fim, TIMESTAMP_FORMAT).timestamp() if args.fim else None
+        for record in read_full_samples(args.consultar, start_epoch, end_epoch):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        sys.exit(0)
+
+    if args.benchmark == "escrita":
+        config = {key: globals()[key] for key in DEFAULT_CONFIG}
+        config["SPOOL_ENABLED"] = False
+        destination = args.destino or tempfile.mkdtemp(prefix="10kk_benchmark_")
+        report = run_write_benchmark(
+            destination, args.agentes, args.duracao, args.intervalo or COLLECTION_INTERVAL_SECONDS,
+            fill_days=args.preenchimento_dias, use_processes=args.processos, config=config
+        )
+        report["destino"] = destination
+        print(json.dumps(report, indent=4, ensure_ascii=False))
+        sys.exit(0)
+
+    if args.benchmark == "coleta":
+        print(json.dumps(run_collection_benchmark(args.iteracoes), indent=4, ensure_ascii=False))
+        sys.exit(0)
+
+    if args.compactar:
+        compact_closed_months(SHARED_NETWORK_PATH, COMPRESSION_FORMAT or DEFAULT_CONFIG["COMPRESSION_FORMAT"])
+        sys.exit(0)
+
+    if args.consumidor:
+        run_consumer(
+            SHARED_NETWORK_PATH,
+            args.checkpoint or os.path.join(application_path, CONSUMER_CHECKPOINT_FILE_NAME),
+            args.snapshot or os.path.join(application_path, CONSUMER_SNAPSHOT_FILE_NAME),
+            COLLECTION_INTERVAL_SECONDS,
+            run_once=args.uma_vez
+        )
+        sys.exit(0)
+
+    if args.merger:
+        run_merger(SHARED_NETWORK_PATH, COLLECTION_INTERVAL_SECONDS, run_once=args.uma_vez)
+        sys.exit(0)
+    
+    logging.info("Iniciando o agente de monitoramento em modo de script.")
+    logging.info(f"Os dados serão salvos em: {os.path.abspath(SHARED_NETWORK_PATH)}")
+
+    agent_profiler = AgentProfiler() if PROFILE_ENABLED else None
+
+    spool = None
+    if SPOOL_ENABLED:
+        spool = LocalSpool(
+            os.path.join(application_path, SPOOL_DIR_NAME),
+            max_bytes=SPOOL_MAX_MB * 1024 * 1024,
+            max_age_seconds=SPOOL_MAX_AGE_HOURS * 3600,
+        )
+        start_spool_flusher(spool, SHARED_NETWORK_PATH, SPOOL_FLUSH_INTERVAL_SECONDS)
+    
+    if METRICS_ENABLED or agent_profiler is not None:
+        start_metrics_reporter(SHARED_NETWORK_PATH, MACHINE_ALIAS or platform.node(), METRICS_DUMP_INTERVAL_SECONDS, write_metrics=METRICS_ENABLED, profiler=agent_profiler)
+
+    rollups = RollupAccumulator(journal_path=os.path.join(application_path, ROLLUP_JOURNAL_FILE_NAME)) if ROLLUPS_ENABLED else None
+    last_retention_date = None
+
+    multi_rate = MultiRateCollector(
+        get_collectors(), METRIC_GROUP_INTERVALS, COLLECTION_INTERVAL_SECONDS,
+        'C:\\' if platform.system() == "Windows" else '/', COLLECTOR_TIMEOUT_SECONDS
+    )
+    logging.info(f"Coleta a cada {multi_rate.tick_interval}s. Intervalos por coletor: {multi_rate.intervals}")
+    if not DELTA_ENCODING and max(multi_rate.intervals.values(), default=0) > multi_rate.tick_interval:
+        logging.info("Grupos lentos são repetidos em todo registro. Ative DELTA_ENCODING para gravar só os valores alterados.")
+
+    def _store_rollups(closed):
+        for level, rollup in closed:
+            rollup_month = datetime.datetime.fromtimestamp(rollup["timestamp_epoch"]).strftime("%Y-%m")
+            if spool is not None:
+                spool.enqueue(rollup, month_folder=rollup_month, rollup_level=level)
+            else:
+                write_rollup_records([rollup], SHARED_NETWORK_PATH, rollup_month, level)
+
+    if rollups is not None:
+        # Janelas que terminaram com o agente parado (ex.: o dia de ontem) são gravadas já na partida;
+        # no encerramento, as que terminaram desde a última coleta. As em curso ficam no diário.
+        _store_rollups(rollups.flush_expired())
+        atexit.register(lambda: _store_rollups(rollups.flush_expired()))
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    def _collect_and_store(scheduled_time):
+        global last_retention_date
+        data = multi_rate.collect(scheduled_time)
+        if data and spool is not None:
+            spool.enqueue(data)
+        elif data:
+            write_data_to_files(data, SHARED_NETWORK_PATH)
+        else:
+            logging.error("Não foi possível coletar dados de hardware. Verifique o log para detalhes.")
+            return
+
+        if rollups is not None:
+            _store_rollups(rollups.add(data))
+
+        if RAW_RETENTION_MONTHS and last_retention_date != scheduled_time.date():
+            apply_raw_retention(SHARED_NETWORK_PATH, data['machine_alias'], RAW_RETENTION_MONTHS, today=scheduled_time.date())
+            last_retention_date = scheduled_time.date()
+
+    def _instrumented_tick(scheduled_time):
+        with profiled(), stage_metrics.timed("ciclo"):
+            _collect_and_store(scheduled_time)
+
+    run_collection_loop(multi_rate.tick_interval, _instrumented_tick)
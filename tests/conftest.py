@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(REPO_DIR, "tests", "fixtures")
+
+
+@pytest.fixture(scope="session")
+def agent():
+    """O script do agente importado como módulo (o nome do arquivo tem espaço, então não dá para usar import)."""
+    spec = importlib.util.spec_from_file_location("agente_10kk", os.path.join(REPO_DIR, "10KK VIEW.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
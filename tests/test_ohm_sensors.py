@@ -0,0 +1,90 @@
+import pytest
+
+
+@pytest.fixture
+def inventario(agent):
+    hardware = [
+        agent.HardwareInfo("/intelcpu/0", "Intel Core i7-10700", "CPU"),
+        agent.HardwareInfo("/nvidiagpu/0", "NVIDIA GeForce GTX 1660", "GpuNvidia"),
+        agent.HardwareInfo("/mainboard", "ASUS PRIME B460M", "Mainboard"),
+        agent.HardwareInfo("/hdd/0", "Samsung SSD 860 EVO", "HDD"),
+        agent.HardwareInfo("/hdd/1", "WDC WD10EZEX", "HDD"),
+    ]
+    Sensor = agent.SensorReading
+    sensors = [
+        Sensor("/intelcpu/0", "CPU Package", "Temperature", 55.126),
+        Sensor("/intelcpu/0", "CPU Core #1", "Temperature", 52.0),
+        Sensor("/intelcpu/0", "CPU Core #2", "Temperature", 53.5),
+        Sensor("/intelcpu/0", "CPU Total", "Load", 17.25),
+        Sensor("/intelcpu/0", "CPU Package", "Power", 35.5),
+        Sensor("/intelcpu/0", "CPU Core #1", "Clock", 4600.0),
+        Sensor("/intelcpu/0", "Bus Speed", "Clock", None),
+        Sensor("/nvidiagpu/0", "GPU Core", "Temperature", 48.0),
+        Sensor("/nvidiagpu/0", "GPU Core", "Load", 12.0),
+        Sensor("/nvidiagpu/0", "GPU Memory Used", "SmallData", 1024.0),
+        Sensor("/nvidiagpu/0", "GPU Memory Free", "SmallData", 5120.0),
+        Sensor("/nvidiagpu/0", "GPU Memory Total", "SmallData", 6144.0),
+        Sensor("/nvidiagpu/0", "GPU Core", "Clock", 1530.0),
+        Sensor("/mainboard", "Temperature #1", "Temperature", 31.0),
+        Sensor("/hdd/0", "Temperature", "Temperature", 36.0),
+        Sensor("/hdd/0", "Used Space", "Load", 64.2),
+        Sensor("/hdd/1", "Temperature", "Temperature", 33.0),
+        Sensor("/hdd/1", "Used Space", "Load", 40.0),
+        Sensor("/hdd/1", "Remaining Life", "Level", 97.0),
+        Sensor("/hdd/1", "Total Bytes Written", "Data", 2 * 1024**4),
+    ]
+    return hardware, sensors
+
+
+def test_parse_ohm_sensors(agent, inventario):
+    hardware, sensors = inventario
+    data = agent.parse_ohm_sensors(hardware, sensors, "C:\\")
+
+    assert data['cpu'] == {
+        "nome": "Intel Core i7-10700",
+        "temperatura_package_celsius": 55.13,
+        "temperaturas_cores_celsius": {"cpu_core_1": 52.0, "cpu_core_2": 53.5},
+        "uso_total_percent": 17.25,
+        "energia_watts": {"cpu_package": 35.5},
+        "clocks_mhz": {"cpu_core_1": 4600.0}
+    }
+    assert data['gpu'] == {
+        "nome": "NVIDIA GeForce GTX 1660",
+        "tipo": "GpuNvidia",
+        "temperatura_core_celsius": 48.0,
+        "uso_percentual": 12.0,
+        "memoria_gpu": {"usada_mb": 1024.0, "livre_mb": 5120.0, "total_mb": 6144.0},
+        "clocks_mhz": {"gpu_core": 1530.0}
+    }
+    assert data['placa_mae'] == {"nome": "ASUS PRIME B460M", "temperaturas_celsius": {"temperature_1": 31.0}}
+    assert data['disco_principal']['nome'] == "Samsung SSD 860 EVO"
+    assert data['disco_principal']['temperatura_celsius'] == 36.0
+    assert data['discos_adicionais'] == [{
+        "nome": "WDC WD10EZEX",
+        "tipo": "HDD",
+        "temperatura_celsius": 33.0,
+        "uso_espaco_percent": 40.0,
+        "vida_util_restante_percent": 97.0,
+        "dados_gravados_tb": 2.0
+    }]
+
+
+def test_coletor_usa_o_provedor(agent, inventario):
+    hardware, sensors = inventario
+    original_provider = agent._sensor_provider
+    agent.set_sensor_provider(agent.FakeSensorProvider(hardware, sensors))
+    try:
+        data = agent._collect_ohm_sensors("C:\\")
+    finally:
+        agent.set_sensor_provider(original_provider)
+    assert data == agent.parse_ohm_sensors(hardware, sensors, "C:\\")
+
+
+def test_inventario_sintetico(agent):
+    hardware, sensors = agent.fake_ohm_inventory(hardware_count=5, sensors_per_hardware=10)
+    data = agent.parse_ohm_sensors(hardware, sensors, "C:\\")
+    assert data['cpu']['nome'] == "Intel Core i7-10700"
+    assert 'temperatura_package_celsius' in data['cpu']
+    assert data['gpu']['nome'] == "NVIDIA GeForce GTX 1660"
+    assert data['placa_mae']['nome'] == "ASUS PRIME B460M"
+    assert [disk['nome'] for disk in data['discos_adicionais']] == ["Disco SSD 3", "Disco SSD 4"]
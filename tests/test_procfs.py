@@ -0,0 +1,128 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import FIXTURES_DIR
+
+PROCFS_FIXTURES = os.path.join(FIXTURES_DIR, "procfs")
+
+
+@pytest.fixture
+def procfs_root(tmp_path):
+    """Cópia da leitura 'antes'; `avancar()` sobrescreve os arquivos no lugar com a leitura 'depois'."""
+    root = tmp_path / "raiz"
+    shutil.copytree(os.path.join(PROCFS_FIXTURES, "antes"), root)
+
+    def avancar():
+        after_dir = os.path.join(PROCFS_FIXTURES, "depois")
+        for directory, _, file_names in os.walk(after_dir):
+            for file_name in file_names:
+                source = os.path.join(directory, file_name)
+                # Mesmo inode: o leitor mantém os descritores abertos e relê com pread.
+                shutil.copyfile(source, root / os.path.relpath(source, after_dir))
+
+    return str(root), avancar
+
+
+def test_primeira_leitura_nao_tem_taxas(agent, procfs_root):
+    root, _ = procfs_root
+    reader = agent.ProcfsReader(root=root)
+    try:
+        assert reader.missing_files() == []
+        data = agent.collect_procfs(reader, now=100.0)
+    finally:
+        reader.close()
+    assert data['cpu']['percentual_uso'] is None
+    assert data['memoria_ram'] == {"total_gb": 16.0, "usado_gb": 12.0, "percentual_uso": 75.0}
+    assert data['rede']['velocidade_atual_mbps'] is None
+    assert data['discos_io'] == {"sda": {}}
+    assert data['uptime_horas'] == 10.0
+
+
+def test_taxas_entre_duas_leituras(agent, procfs_root):
+    root, avancar = procfs_root
+    reader = agent.ProcfsReader(root=root)
+    try:
+        agent.collect_procfs(reader, now=100.0)
+        avancar()
+        data = agent.collect_procfs(reader, now=110.0)
+    finally:
+        reader.close()
+
+    # /proc/stat: ocupado = total - (idle + iowait), nos 8 primeiros campos
+    assert data['cpu']['percentual_uso'] == 50.0
+    assert data['cpu']['uso_nucleos_percent'] == {"cpu_core_1": 60.0, "cpu_core_2": 46.7}
+
+    # /proc/net/dev: bytes recebidos no campo 0 e enviados no campo 8; loopback ignorado
+    assert data['rede']['interfaces'] == {"eth0": {"recebido_mbps": 1.0, "enviado_mbps": 0.2}}
+    assert data['rede']['velocidade_atual_mbps'] == 1.2
+
+    # /proc/diskstats: só discos inteiros (sda1 e loop0 ficam de fora); os campos "merged",
+    # "em andamento" e "ponderado" mudam entre as leituras e não podem aparecer nas taxas
+    assert data['discos_io'] == {
+        "sda": {
+            "leituras_s": 10.0,
+            "escritas_s": 5.0,
+            "leitura_mb_s": 1.0,
+            "escrita_mb_s": 2.0,
+            "latencia_leitura_ms": 2.0,
+            "latencia_escrita_ms": 5.0,
+            "utilizacao_percent": 25.0
+        }
+    }
+    assert data['disco_io'] == {"leitura_mb_s": 1.0, "escrita_mb_s": 2.0}
+    assert data['uptime_horas'] == 10.0
+
+
+def test_arquivo_ausente(agent, tmp_path):
+    root = tmp_path / "raiz"
+    shutil.copytree(os.path.join(PROCFS_FIXTURES, "antes"), root)
+    os.remove(root / "proc" / "diskstats")
+    assert agent.ProcfsReader(root=str(root)).missing_files() == ["proc/diskstats"]
+
+
+def test_rotulos_do_hwmon(agent, procfs_root):
+    root, _ = procfs_root
+    reader = agent.ProcfsReader(root=root)
+    try:
+        readings = reader.read_temperatures()
+    finally:
+        reader.close()
+    assert readings == [
+        ("coretemp", "Package id 0", 45.0),
+        ("coretemp", "Core 0", 42.0),
+        ("coretemp", "Core 1", 43.5),
+        ("nvme", "Composite", 38.85),
+        ("acpitz", "temp1", 27.8),
+        ("amdgpu", "edge", 51.0)
+    ]
+
+    data = agent.parse_hwmon_temperatures(readings)
+    assert data['cpu']['temperatura_package_celsius'] == 45.0
+    assert data['cpu']['temperaturas_cores_celsius'] == {"cpu_core_1": 42.0, "cpu_core_2": 43.5}
+    assert data['gpu'] == {"nome": "amdgpu", "temperatura_core_celsius": 51.0}
+    assert data['placa_mae']['temperaturas_celsius'] == {"acpitz_temp1": 27.8}
+    assert data['discos_adicionais'] == [{"nome": "nvme", "tipo": "HDD", "temperatura_celsius": 38.85}]
+
+
+def test_discos_inteiros_em_cache(agent, procfs_root, monkeypatch):
+    root, _ = procfs_root
+    reader = agent.ProcfsReader(root=root)
+    listed = []
+    real_listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listed.append(path) or real_listdir(path))
+    try:
+        reader.read_disks(100.0)
+        reader.read_disks(110.0)
+        assert len(listed) == 1
+
+        # Disco novo: /sys/block é relido uma vez e o dispositivo passa a ser medido.
+        os.makedirs(os.path.join(root, "sys", "block", "sdb"))
+        with open(os.path.join(root, "proc", "diskstats"), "a") as f:
+            f.write("   8      16 sdb 10 0 80 1 0 0 0 0 0 1 1 0 0 0 0 0 0\n")
+        assert set(reader.read_disks(120.0)) == {"sda", "sdb"}
+        reader.read_disks(130.0)
+        assert len(listed) == 2
+    finally:
+        reader.close()